@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+'''
+    benchmarks
+    ~~~~~~~~~~
+
+    Count the calls into vim *(evals, commands, buffer and window object
+    access)* that the gui makes for common operations, using the headless
+    vim in :mod:`tests.fakevim`. Each benchmark runs in its own process, so
+    that module level state from one doesn't leak into the next. Eg..::
+
+        python benchmarks.py            # Run them all.
+        python benchmarks.py scope_refresh_1000
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+import json
+import subprocess
+import sys
+import time
+from xml.dom import minidom
+
+from tests import fakevim
+
+
+#: The benchmarks, in the order they are run.
+BENCHMARKS = []
+
+#: Crossings measured before the changes a benchmark was written for,
+#: printed under its own numbers. The layout build, before
+#: vim_tools.commands batched its commands and after; the unbatched
+#: code needed its `getwinvar()` id check fixed to run at all.
+BASELINES = {
+    'gui_load':[
+        ('unbatched', {'eval':121, 'command':77, 'buffer':0, 'window':0,
+                       'focus':36}),
+        ('batched', {'eval':66, 'command':29, 'buffer':0, 'window':0,
+                     'focus':19}),
+    ],
+}
+
+def benchmark(func):
+    '''Register a benchmark. It is given the fake vim once it is installed,
+    does its setup, and returns a function running the operation to count.
+    '''
+    BENCHMARKS.append(func)
+    return func
+
+def stack_response(depth, recursive=False):
+    '''A stack_get response with depth frames; all but the first are the
+    same frame if recursive.'''
+    frames = ''.join(
+        '<stack level="%d" type="file" filename="file:///src/module%d.py" '
+        'lineno="%d" where="function_%d"/>' % ((level,) + (
+            (1, 10, 1) if recursive and level else (level % 7, level + 1, level)))
+        for level in range(depth))
+    return minidom.parseString(
+        '<response command="stack_get" transaction_id="1">%s</response>'
+        % frames).documentElement
+
+def scope_properties(count, generation=0):
+    '''count (name, value, type, children) properties, a few of which change
+    with each generation.'''
+    return [('variable_%d' % i, str(i + (generation if i % 100 == 0 else 0)), 'int', 0)
+            for i in range(count)]
+
+def debug_ui():
+    '''A started DebugUI.'''
+    from vim_debug.ui import DebugUI
+    ui = DebugUI()
+    ui.startup()
+    return ui
+
+@benchmark
+def gui_load(fake):
+    from vimbug.interface import VimGui
+    return VimGui(None).load
+
+@benchmark
+def debugui_startup(fake):
+    from vim_debug.ui import DebugUI
+    return DebugUI().startup
+
+def stack_draw(depth, recursive=False):
+    def setup(fake):
+        ui = debug_ui()
+        stack = ui.windows['stack']
+        node = stack_response(depth, recursive)
+        def run():
+            stack.reset()
+            stack.update(node)
+            stack.draw()
+        return run
+    setup.__name__ = 'stack_draw_%d%s' % (depth, recursive and '_recursive' or '')
+    return benchmark(setup)
+
+stack_draw(1000)
+stack_draw(1000, recursive=True)
+
+def scope_refresh(count):
+    def setup(fake):
+        from vim_debug.context import ContextCache
+        ui = debug_ui()
+        scope = ui.windows['scope']
+        contexts = ContextCache()
+        contexts.update(0, scope_properties(count))
+        scope.refresh(contexts)
+        # Count the second step, where only a few values changed.
+        contexts.update(0, scope_properties(count, generation=1))
+        return lambda: scope.refresh(contexts)
+    setup.__name__ = 'scope_refresh_%d' % count
+    return benchmark(setup)
+
+scope_refresh(50)
+scope_refresh(500)
+scope_refresh(5000)
+
+@benchmark
+def output_add_flush(fake):
+    ui = debug_ui()
+    output = ui.windows['output']
+    def run():
+        for i in range(1000):
+            output.add('stdout', 'line %d\n' % i)
+        output.flush()
+    return run
+
+@benchmark
+def buffer_write_10000(fake):
+    from vimbug.vim_tools.gui import Buffer
+    buffer = Buffer(name='BIG')
+    text = '\n'.join('line %d' % i for i in range(10000))
+    return lambda: buffer.write(text)
+
+#: Written lines, for the lines/s column.
+buffer_write_10000.lines = 10000
+
+def run(name):
+    '''Run one benchmark in this process.
+
+    :returns:
+        The crossings dict of :meth:`tests.fakevim.FakeVim.crossings()`,
+        plus the wall clock time of the whole operation and, for benchmarks
+        which write lines, the lines written per second.
+    '''
+    fake = fakevim.install()
+    func = dict((func.__name__, func) for func in BENCHMARKS)[name]
+    operation = func(fake)
+    fake.reset_calls()
+    start = time.time()
+    operation()
+    wall = time.time() - start
+    crossings = fake.crossings()
+    crossings['wall'] = wall
+    crossings['unknown'] = len(fake.unknown)
+    lines = getattr(func, 'lines', 0)
+    crossings['lines/s'] = lines / wall if lines and wall else None
+    return crossings
+
+def main(names):
+    columns = ('eval', 'command', 'buffer', 'window', 'focus', 'seconds',
+               'wall', 'lines/s')
+    print '%-26s' % 'benchmark' + ''.join('%10s' % column for column in columns)
+    for name in names or [func.__name__ for func in BENCHMARKS]:
+        output = subprocess.check_output(
+            [sys.executable, __file__, '--json', name])
+        crossings = json.loads(output)
+        print '%-26s' % name + ''.join(
+            '%10s' % '-' if crossings[column] is None
+            else '%10.4f' % crossings[column] if column in ('seconds', 'wall')
+            else '%10d' % crossings[column] for column in columns)
+        for label, baseline in BASELINES.get(name, ()):
+            print '%-26s' % ('  ' + label) + ''.join(
+                '%10d' % baseline[column] if column in baseline
+                else '%10s' % '-' for column in columns)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--json']:
+        print json.dumps(run(sys.argv[2]))
+    else:
+        main(sys.argv[1:])
@@ -3,10 +3,22 @@ from attest import Tests
 from tests.dbgp.socket_ import socktest
 from tests.dbgp.dbgpconnection import dbgpcon_test
 from tests.dbgp.dbgp import dbgp_test
+from tests.dbgp.capabilities import capabilities_test
+from tests.vim_debug.context import context_test
+from tests.vim_debug.packets import packets_test
+from tests.vim_debug.signs import signs_test
+from tests.vim_debug.sources import sources_test
+from tests.vim_debug.scope import scope_test
 
 tests = Tests([
     socktest,
     dbgpcon_test,
     dbgp_test,
+    capabilities_test,
+    context_test,
+    packets_test,
+    signs_test,
+    sources_test,
+    scope_test,
 ])
 
@@ -0,0 +1,173 @@
+# coding: utf-8
+'''
+    tests.dbgp.capabilities
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+import os
+import shutil
+import tempfile
+
+from attest import Tests
+
+from vimbug.dbgp import CapabilityCache, DBGP, DBGPConnection
+
+
+# Our test object
+capabilities_test = Tests()
+
+@capabilities_test.context
+def cache_path():
+    '''Create a temporary directory to hold the cache file.'''
+    directory = tempfile.mkdtemp()
+    try:
+        yield os.path.join(directory, 'nested', 'capabilities.json')
+    finally:
+        shutil.rmtree(directory)
+
+@capabilities_test.test
+def missing_cache(path):
+    '''Nothing is cached before the first session.'''
+    cache = CapabilityCache(path)
+
+    assert cache.get('pydbgp 1.1.0 python') is None
+
+@capabilities_test.test
+def cache_roundtrip(path):
+    '''Capabilities stored by one session are read back by the next.'''
+    capabilities = {
+        'features':{'eval':True, 'break':False},
+        'typemap':{'int':'int'},
+        'contexts':{'0':'Locals', '1':'Globals'},
+    }
+    CapabilityCache(path).set('pydbgp 1.1.0 python', capabilities)
+    CapabilityCache(path).set('xdebug 2.1.0 PHP', {})
+
+    cache = CapabilityCache(path)
+    assert cache.get('pydbgp 1.1.0 python') == capabilities
+    assert cache.get('xdebug 2.1.0 PHP') == {}
+
+
+#: The init packet pydbgp sends, namespace and all.
+INIT = ('<init xmlns="urn:debugger_protocol_v1" appid="1234" idekey="vimbug" '
+        'language="python" protocol_version="1.0" '
+        'fileuri="file:///src/no_imports.py">'
+        '<engine version="1.1.0"><![CDATA[pydbgp]]></engine>'
+        '</init>')
+
+class FakeSocket(object):
+    '''Stands in for the socket of a :class:`SocketListener`, answering
+    with canned packets.'''
+
+    def __init__(self, packets):
+        #: The packets still to be received, in order.
+        self.packets = list(packets)
+        #: The commands sent, in order.
+        self.sent = []
+
+    def receive(self):
+        if not self.packets:
+            return None
+        return self.packets.pop(0)
+
+    def send(self, data, suffix=''):
+        self.sent.append(data)
+
+def connection(packets):
+    '''A DBGPConnection that talks to a :class:`FakeSocket`.'''
+    dbgpcon = DBGPConnection('no_imports.py')
+    dbgpcon._listener.socket = FakeSocket(packets)
+    return dbgpcon
+
+@capabilities_test.test
+def init_engine(path):
+    '''The engine name and version are read from the init packet.'''
+    dbgpcon = connection([INIT])
+    init = dbgpcon.read_init()
+
+    assert init['engine'] == 'pydbgp'
+    assert init['engine_version'] == '1.1.0'
+    assert init['language'] == 'python'
+    assert dbgpcon.engine_key() == 'pydbgp 1.1.0 python'
+
+@capabilities_test.test
+def init_without_engine(path):
+    '''An engine that doesn't name itself gets no key, so it never shares
+    a cache entry with another one.'''
+    dbgpcon = connection(['<init language="php" protocol_version="1.0"/>'])
+    dbgpcon.read_init()
+
+    assert dbgpcon.engine_key() is None
+
+@capabilities_test.test
+def query_responses(path):
+    '''All the queries are sent up front, and each kind of response is
+    read into its part of the capabilities.'''
+    ns = 'xmlns="urn:debugger_protocol_v1"'
+    dbgpcon = connection([
+        '<response %s command="feature_get" transaction_id="1" '
+        'feature_name="eval" supported="1"/>' % ns,
+        '<response %s command="feature_get" transaction_id="2" '
+        'feature_name="break" supported="0"/>' % ns,
+        # Stream packets can turn up in between, and are skipped.
+        '<stream %s type="stdout">aGk=</stream>' % ns,
+        '<response %s command="typemap_get" transaction_id="3">'
+        '<map type="int" name="int"/><map type="string" name="str"/>'
+        '</response>' % ns,
+        '<response %s command="context_names" transaction_id="4">'
+        '<context name="Locals" id="0"/><context name="Globals" id="1"/>'
+        '</response>' % ns,
+    ])
+    capabilities = dbgpcon.query_capabilities(commands=('eval', 'break'))
+
+    sent = dbgpcon._listener.socket.sent
+    assert [command.split()[0] for command in sent] == [
+        'feature_get', 'feature_get', 'typemap_get', 'context_names']
+    assert capabilities == {
+        'features':{'eval':True, 'break':False},
+        'typemap':{'int':'int', 'str':'string'},
+        'contexts':{'0':'Locals', '1':'Globals'},
+    }
+
+@capabilities_test.test
+def query_cut_short(path):
+    '''A server that stops answering leaves what it did answer.'''
+    dbgpcon = connection([
+        '<response command="feature_get" transaction_id="1" '
+        'feature_name="eval" supported="1"/>',
+    ])
+    capabilities = dbgpcon.query_capabilities(commands=('eval', 'break'))
+
+    assert capabilities['features'] == {'eval':True}
+
+@capabilities_test.test
+def unnamed_engine_not_cached(path):
+    '''The capabilities of an engine without a name are queried, but not
+    stored for the next session.'''
+    dbgp = DBGP(capability_cache=CapabilityCache(path))
+    dbgp._dbgpcon = connection(['<init language="php" protocol_version="1.0"/>'])
+    dbgp._dbgpcon.read_init()
+
+    assert dbgp.capabilities() == {'features':{}, 'typemap':{}, 'contexts':{}}
+    assert CapabilityCache(path)._load() == {}
+
+@capabilities_test.test
+def partial_entry_queried(path):
+    '''An entry holding only the context names, as the vim_debug plugin
+    stores them, is queried in full and then completed.'''
+    CapabilityCache(path).set('pydbgp 1.1.0 python',
+                              {'contexts':{'0':'Locals'}})
+    dbgp = DBGP(capability_cache=CapabilityCache(path))
+    dbgp._dbgpcon = connection([
+        INIT,
+        '<response command="context_names" transaction_id="17">'
+        '<context name="Locals" id="0"/><context name="Globals" id="1"/>'
+        '</response>',
+    ])
+    dbgp._dbgpcon.read_init()
+
+    assert dbgp.capabilities()['contexts'] == {'0':'Locals', '1':'Globals'}
+    assert sorted(CapabilityCache(path).get('pydbgp 1.1.0 python')) == [
+        'contexts', 'features', 'typemap']
@@ -0,0 +1,1435 @@
+# coding: utf-8
+'''
+    tests.fakevim
+    ~~~~~~~~~~~~~
+
+    A headless stand-in for the `vim` module, so that the gui code can be
+    driven, counted and timed outside of vim. It models tabs, windows,
+    buffers, window variables, signs and matches, and evaluates the subset
+    of Vimscript the gui actually uses. Anything it doesn't know is
+    recorded in :attr:`FakeVim.unknown` rather than failing.
+
+    Every call that crosses from python into vim *(eval, command, and
+    reads and writes through buffer and window objects)* is recorded in
+    :attr:`FakeVim.calls` with its duration. Eg..::
+
+        fake = fakevim.install()
+        from vimbug.interface import VimGui
+        VimGui(None).load()
+        print fake.crossings()
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+import os
+import re
+import sys
+import time
+
+
+#: The functions `exists("*name")` reports. Drop some with `missing` to
+#: play an older vim.
+FUNCTIONS = [
+    'bufexists', 'bufname', 'bufnr', 'bufwinnr', 'execute', 'exists', 'expand',
+    'float2nr', 'getchar', 'gettabvar', 'getwininfo', 'getwinvar', 'has',
+    'len', 'map', 'matchaddpos', 'matchdelete', 'range', 'setbufvar',
+    'setwinvar', 'sign_placelist', 'sign_unplacelist', 'tabpagenr',
+    'timer_start', 'timer_stop', 'win_execute', 'win_getid', 'win_gotoid',
+    'win_id2win', 'winbufnr', 'winheight', 'winlayout', 'winnr', 'winrestcmd',
+    'winwidth',
+]
+#: The events `exists("##Event")` reports.
+EVENTS = [
+    'BufEnter', 'CursorHold', 'CursorMoved', 'TabEnter', 'WinClosed',
+    'WinEnter', 'WinNew', 'WinScrolled',
+]
+#: The features `has()` reports.
+FEATURES = ['lambda', 'python', 'signs', 'timers', 'windows']
+
+
+class error(Exception):
+    '''Raised where vim would raise `vim.error`.'''
+
+
+class Lambda(object):
+    '''A `{-> expr}` lambda. Only kept around to be called by a timer.'''
+
+    def __init__(self, source):
+        self.source = source
+
+
+class Buffer(object):
+    '''A vim buffer, and the python object vim hands out for it.'''
+
+
+    def __init__(self, fake, number, name=''):
+        self._fake = fake
+        self.number = number
+        self.name = name
+        self.lines = ['']
+        self.vars = {}
+        self.options = {'buftype':'', 'bufhidden':''}
+        self.signs = {}
+        self.wiped = False
+        self.loaded = True
+
+    def __dir__(self):
+        # Vim empties the dir() of a wiped out buffer.
+        if self.wiped:
+            return []
+        return ['append', 'name', 'number', 'range', 'vars', 'options']
+
+    def __len__(self):
+        self._fake._record('buffer', 'len')
+        return len(self.lines)
+
+    def __iter__(self):
+        self._fake._record('buffer', 'iter')
+        return iter(list(self.lines))
+
+    def __getitem__(self, index):
+        self._fake._record('buffer', 'get')
+        return self.lines[index]
+
+    def __setitem__(self, index, value):
+        start = time.time()
+        if isinstance(index, slice):
+            self.lines[index] = [_line(line) for line in value]
+        else:
+            self.lines[index] = _line(value)
+        if not self.lines:
+            self.lines = ['']
+        self._fake._record('buffer', 'set', start)
+
+    def __delitem__(self, index):
+        start = time.time()
+        del self.lines[index]
+        if not self.lines:
+            self.lines = ['']
+        self._fake._record('buffer', 'del', start)
+
+    # Python 2 still calls these for plain slices.
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(i, j))
+
+    def __setslice__(self, i, j, value):
+        self.__setitem__(slice(i, j), value)
+
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(i, j))
+
+    def append(self, value, nr=None):
+        start = time.time()
+        if nr is None:
+            nr = len(self.lines)
+        if isinstance(value, (list, tuple)):
+            self.lines[nr:nr] = [_line(line) for line in value]
+        else:
+            self.lines.insert(nr, _line(value))
+        self._fake._record('buffer', 'append', start)
+
+    def range(self, start, end):
+        '''Lines start through end, counting from 1, like vim's.'''
+        return Range(self, start - 1, end)
+
+
+class Range(object):
+    '''A `buffer.range()` object.'''
+
+
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+    def _slice(self, index):
+        if isinstance(index, slice):
+            first, last, _ = index.indices(self.end - self.start)
+            return slice(self.start + first, self.start + max(first, last))
+        if index < 0:
+            index += self.end - self.start
+        return self.start + index
+
+    def __len__(self):
+        self.buffer._fake._record('buffer', 'len')
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        return self.buffer[self._slice(index)]
+
+    def __setitem__(self, index, value):
+        target = self._slice(index)
+        if isinstance(target, slice):
+            self.end += len(value) - (target.stop - target.start)
+        self.buffer[target] = value
+
+    def __delitem__(self, index):
+        target = self._slice(index)
+        if isinstance(target, slice):
+            self.end -= target.stop - target.start
+        else:
+            self.end -= 1
+        del self.buffer[target]
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(i, j))
+
+    def __setslice__(self, i, j, value):
+        self.__setitem__(slice(i, j), value)
+
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(i, j))
+
+    def append(self, value, nr=None):
+        if nr is None:
+            nr = self.end - self.start
+        self.buffer.append(value, self.start + nr)
+        if isinstance(value, (list, tuple)):
+            self.end += len(value)
+        else:
+            self.end += 1
+
+
+class Window(object):
+    '''A vim window, and the python object vim hands out for it.'''
+
+
+    def __init__(self, fake, winid, buffer, width, height):
+        self._fake = fake
+        self.winid = winid
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.vars = {}
+        self.options = {}
+        self.matches = {}
+        self.topline = 1
+        self._cursor = (1, 0)
+
+    @property
+    def cursor(self):
+        self._fake._record('window', 'get cursor')
+        return self._cursor
+
+    @cursor.setter
+    def cursor(self, value):
+        self._fake._record('window', 'set cursor')
+        self._cursor = tuple(value)
+
+    @property
+    def number(self):
+        return self._fake.windows.index(self) + 1
+
+    @property
+    def botline(self):
+        return min(len(self.buffer.lines), self.topline + self.height - 1)
+
+
+class Tab(object):
+    '''A tab page, holding windows in winnr order.'''
+
+
+    def __init__(self, window):
+        self.windows = [window]
+        self.current = window
+        self.previous = window
+        self.vars = {}
+
+
+class Current(object):
+    '''`vim.current`.'''
+
+
+    def __init__(self, fake):
+        self._fake = fake
+
+    @property
+    def buffer(self):
+        return self._fake.tab.current.buffer
+
+    @property
+    def window(self):
+        return self._fake.tab.current
+
+    @property
+    def line(self):
+        window = self._fake.tab.current
+        return window.buffer.lines[window._cursor[0] - 1]
+
+
+class Buffers(object):
+    '''`vim.buffers`. Both a mapping of numbers to buffers and iterable.'''
+
+
+    def __init__(self, fake):
+        self._fake = fake
+
+    def __getitem__(self, number):
+        for buffer in self._fake.buffer_list:
+            if buffer.number == number:
+                return buffer
+        raise KeyError(number)
+
+    def __iter__(self):
+        return iter(list(self._fake.buffer_list))
+
+    def __len__(self):
+        return len(self._fake.buffer_list)
+
+
+def _line(value):
+    '''Check a line written through a buffer object, as vim would.'''
+    value = str(value)
+    if '\n' in value:
+        # Real vims refuse this. Keep going, but only up to the newline,
+        # so that whatever did it shows up in the buffer.
+        value = value.replace('\n', ' ')
+    return value
+
+
+class FakeVim(object):
+    '''The stand-in `vim` module.'''
+
+
+    error = error
+
+    def __init__(self, lines=50, columns=200, missing=()):
+        '''
+        :param lines:
+            The value of `&lines`.
+        :param columns:
+            The value of `&columns`.
+        :param missing:
+            A list of function names *(without the `*`)*, event names and
+            features to leave out, to play an older vim.
+        '''
+        self.settings = {'lines':lines, 'columns':columns, 'showtabline':1,
+                         'hidden':0}
+        self.functions = set(FUNCTIONS) - set(missing)
+        self.events = set(EVENTS) - set(missing)
+        self.features = set(FEATURES) - set(missing)
+
+        #: Every crossing, as `(kind, text, seconds)` tuples.
+        self.calls = []
+        #: Commands and functions this fake doesn't know.
+        self.unknown = []
+        #: What `:echo` printed.
+        self.messages = []
+        #: The files read from disk into buffers, in order.
+        self.reads = []
+        #: The commands registered with :meth:`user_command()`.
+        self.user_commands = {}
+
+        self.globals = {}
+        self.timers = {}
+        self.autocmds = []
+        self.group = None
+        self.buffer_list = []
+        self.next_bufnr = 1
+        self.next_winid = 1000
+        self.next_timer = 1
+        self._depth = 0
+
+        self.buffers = Buffers(self)
+        self.current = Current(self)
+
+        window = self._new_window(self._new_buffer(''), columns, lines - 2)
+        self.tabs = [Tab(window)]
+        self.tab = self.tabs[0]
+
+    # -- Recording ---------------------------------------------------------
+
+    def _record(self, kind, text, start=None):
+        if self._depth:
+            return
+        if start is None:
+            elapsed = 0.0
+        else:
+            elapsed = time.time() - start
+        self.calls.append((kind, text, elapsed))
+
+    def reset_calls(self):
+        '''Forget the calls recorded so far.'''
+        self.calls = []
+
+    def crossings(self):
+        '''Count the recorded calls.
+
+        :returns:
+            A dict of kind *(`eval`, `command`, `buffer`, `window`)* to the
+            number of calls, plus `focus` for the number of times the
+            current window changed, and `seconds` for the time spent.
+        '''
+        counts = {'eval':0, 'command':0, 'buffer':0, 'window':0,
+                  'focus':0, 'seconds':0.0}
+        for kind, text, elapsed in self.calls:
+            counts[kind] = counts.get(kind, 0) + 1
+            counts['seconds'] += elapsed
+        return counts
+
+    def user_command(self, name, func):
+        '''Define a user command, such as `Dbg`.
+
+        :param func:
+            Called with the rest of the command line.
+        '''
+        self.user_commands[name] = func
+
+    # -- The vim module ----------------------------------------------------
+
+    def eval(self, expression):
+        start = time.time()
+        self._depth += 1
+        try:
+            result = _to_vim_result(self._eval(expression))
+        finally:
+            self._depth -= 1
+        self._record('eval', expression, start)
+        return result
+
+    def command(self, command_):
+        start = time.time()
+        self._depth += 1
+        try:
+            self._run(command_)
+        finally:
+            self._depth -= 1
+        self._record('command', command_, start)
+
+    @property
+    def windows(self):
+        '''`vim.windows`, the windows of the current tab.'''
+        return self.tab.windows
+
+    # -- State -------------------------------------------------------------
+
+    def _new_buffer(self, name):
+        buffer = Buffer(self, self.next_bufnr, name)
+        self.next_bufnr += 1
+        self.buffer_list.append(buffer)
+        return buffer
+
+    def _new_window(self, buffer, width, height):
+        window = Window(self, self.next_winid, buffer, width, height)
+        self.next_winid += 1
+        return window
+
+    def _focus(self, window):
+        tab = self.tab
+        if window is tab.current:
+            return
+        tab.previous = tab.current
+        tab.current = window
+        self.calls.append(('focus', 'window %s' % window.winid, 0.0))
+        self._fire('WinEnter')
+        self._fire('BufEnter')
+
+    def _find_buffer(self, expression, create=False):
+        '''Find a buffer the way bufnr() does.'''
+        if isinstance(expression, int) or (
+                isinstance(expression, str) and expression.isdigit()):
+            for buffer in self.buffer_list:
+                if buffer.number == int(expression) and not buffer.wiped:
+                    return buffer
+            return None
+        if expression in ('%', ''):
+            return self.tab.current.buffer
+        if expression == '#':
+            return self.tab.previous.buffer
+        if expression == '$':
+            return self.buffer_list[-1]
+        living = [buffer for buffer in self.buffer_list if not buffer.wiped]
+        for buffer in living:
+            if buffer.name == expression:
+                return buffer
+        partial = [buffer for buffer in living if expression in buffer.name]
+        if len(partial) == 1:
+            return partial[0]
+        if create:
+            return self._new_buffer(expression)
+        return None
+
+    def _window(self, number):
+        '''A window of the current tab by number, 0 being the current one.'''
+        number = int(number)
+        if number == 0:
+            return self.tab.current
+        if 0 < number <= len(self.windows):
+            return self.windows[number - 1]
+        return None
+
+    def _window_by_id(self, winid):
+        for tab in self.tabs:
+            for window in tab.windows:
+                if window.winid == int(winid):
+                    return tab, window
+        return None, None
+
+    def _fire(self, event):
+        for group, events, pattern, command_, owner in list(self.autocmds):
+            if event not in events:
+                continue
+            if pattern == '<buffer>' and owner is not self.tab.current.buffer:
+                continue
+            self._run(command_)
+
+    # -- Expressions -------------------------------------------------------
+
+    def _eval(self, expression, local=None):
+        parser = _Parser(self, expression, local or {})
+        value = parser.expression()
+        parser.expect(None)
+        return value
+
+    def _variable(self, name, local):
+        if name in local:
+            return local[name]
+        scope, _, key = name.partition(':')
+        if not key:
+            raise error('E121: Undefined variable: %s' % name)
+        if scope == 'g':
+            values = self.globals
+        elif scope == 'w':
+            values = self.tab.current.vars
+        elif scope == 'b':
+            values = self.tab.current.buffer.vars
+        elif scope == 't':
+            values = self.tab.vars
+        else:
+            raise error('E121: Undefined variable: %s' % name)
+        if key not in values:
+            raise error('E121: Undefined variable: %s' % name)
+        return values[key]
+
+    def _exists(self, name):
+        if name.startswith('*'):
+            return name[1:] in self.functions
+        if name.startswith('##'):
+            return name[2:] in self.events
+        if name.startswith('&'):
+            return True
+        try:
+            self._variable(name, {})
+        except error:
+            return False
+        return True
+
+    def _call(self, name, args):
+        if name not in self.functions:
+            raise error('E117: Unknown function: %s' % name)
+        method = getattr(self, '_f_%s' % name, None)
+        if method is None:
+            self.unknown.append(name)
+            return 0
+        return method(*args)
+
+    def _f_bufexists(self, expression):
+        return int(self._find_buffer(expression) is not None)
+
+    def _f_bufname(self, expression):
+        buffer = self._find_buffer(expression)
+        return buffer.name if buffer is not None else ''
+
+    def _f_bufnr(self, expression, create=0):
+        buffer = self._find_buffer(expression, bool(create))
+        return buffer.number if buffer is not None else -1
+
+    def _f_bufwinnr(self, expression):
+        buffer = self._find_buffer(expression)
+        for window in self.windows:
+            if window.buffer is buffer:
+                return window.number
+        return -1
+
+    def _f_execute(self, commands_, silent=''):
+        if not isinstance(commands_, list):
+            commands_ = [commands_]
+        for command_ in commands_:
+            self._run(command_)
+        return ''
+
+    def _f_exists(self, name):
+        return int(self._exists(name))
+
+    def _f_expand(self, expression):
+        if expression == '<cword>':
+            window = self.tab.current
+            words = re.findall(r'\w+', self.current.line)
+            return words[0] if words else ''
+        return expression
+
+    def _f_float2nr(self, value):
+        return int(value)
+
+    def _f_getchar(self, peek=0):
+        return 0
+
+    def _f_getwininfo(self, winid=None):
+        tabs = self.tabs
+        info = []
+        for tabnr, tab in enumerate(tabs):
+            for window in tab.windows:
+                if winid is not None and window.winid != int(winid):
+                    continue
+                info.append({
+                    'winid':window.winid, 'winnr':tab.windows.index(window) + 1,
+                    'tabnr':tabnr + 1, 'bufnr':window.buffer.number,
+                    'width':window.width, 'height':window.height,
+                    'topline':window.topline, 'botline':window.botline,
+                    'variables':window.vars,
+                })
+        return info
+
+    def _f_getwinvar(self, number, name, default=''):
+        window = self._window(number)
+        if window is None:
+            return default
+        return window.vars.get(name, default)
+
+    def _f_gettabvar(self, number, name, default=''):
+        if not 0 < number <= len(self.tabs):
+            return default
+        return self.tabs[number - 1].vars.get(name, default)
+
+    def _f_has(self, feature):
+        return int(feature in self.features)
+
+    def _f_len(self, value):
+        return len(value)
+
+    def _f_map(self, values, expression):
+        if isinstance(values, dict):
+            return dict((key, self._eval(expression, {'v:val':value, 'v:key':key}))
+                        for key, value in values.items())
+        return [self._eval(expression, {'v:val':value, 'v:key':index})
+                for index, value in enumerate(values)]
+
+    def _f_matchaddpos(self, group, positions, priority=10, id=-1, opts=None):
+        window = self.tab.current
+        if opts and 'window' in opts:
+            window = self._window_by_id(opts['window'])[1]
+        if id == -1:
+            id = max([1000] + list(window.matches)) + 1
+        if id in window.matches:
+            raise error('E801: ID already taken: %s' % id)
+        window.matches[id] = (group, positions)
+        return id
+
+    def _f_matchdelete(self, id, winid=None):
+        window = self.tab.current
+        if winid is not None:
+            window = self._window_by_id(winid)[1]
+        if id not in window.matches:
+            raise error('E803: ID not found: %s' % id)
+        del window.matches[id]
+        return 0
+
+    def _f_range(self, first, last=None):
+        if last is None:
+            return list(range(first))
+        return list(range(first, last + 1))
+
+    def _f_setbufvar(self, expression, name, value):
+        buffer = self._find_buffer(expression)
+        if buffer is not None:
+            if name.startswith('&'):
+                buffer.options[name[1:]] = value
+            else:
+                buffer.vars[name] = value
+        return 0
+
+    def _f_setwinvar(self, number, name, value):
+        window = self._window(number)
+        if window is not None:
+            window.vars[name] = value
+        return 0
+
+    def _f_sign_placelist(self, signs):
+        ids = []
+        for sign in signs:
+            buffer = self._find_buffer(sign['buffer'])
+            if buffer is None:
+                raise error('E158: Invalid buffer name: %s' % sign['buffer'])
+            key = (sign.get('group', ''), int(sign['id']))
+            buffer.signs[key] = (sign['name'], int(sign['lnum']))
+            ids.append(int(sign['id']))
+        return ids
+
+    def _f_sign_unplacelist(self, signs):
+        result = []
+        for sign in signs:
+            buffer = self._find_buffer(sign['buffer'])
+            key = (sign.get('group', ''), int(sign['id']))
+            if buffer is None or key not in buffer.signs:
+                result.append(-1)
+                continue
+            del buffer.signs[key]
+            result.append(0)
+        return result
+
+    def _f_tabpagenr(self, arg=''):
+        if arg == '$':
+            return len(self.tabs)
+        return self.tabs.index(self.tab) + 1
+
+    def _f_timer_start(self, time_, callback, options=None):
+        id = self.next_timer
+        self.next_timer += 1
+        self.timers[id] = callback
+        return id
+
+    def _f_timer_stop(self, id):
+        self.timers.pop(id, None)
+        return 0
+
+    def _f_win_execute(self, winid, command_, silent=''):
+        tab, window = self._window_by_id(winid)
+        if window is None:
+            return ''
+        # No autocmds, no focus change. Just a different context.
+        original = self.tab, tab.current
+        self.tab, tab.current = tab, window
+        try:
+            if isinstance(command_, list):
+                for line in command_:
+                    self._run(line)
+            else:
+                self._run(command_)
+        finally:
+            tab.current = original[1]
+            self.tab = original[0]
+        return ''
+
+    def _f_win_getid(self, number=0, tabnr=None):
+        window = self._window(number)
+        return window.winid if window is not None else 0
+
+    def _f_win_gotoid(self, winid):
+        tab, window = self._window_by_id(winid)
+        if window is None:
+            return 0
+        if tab is not self.tab:
+            self.tab = tab
+            self._fire('TabEnter')
+        self._focus(window)
+        return 1
+
+    def _f_win_id2win(self, winid):
+        tab, window = self._window_by_id(winid)
+        if tab is not self.tab:
+            return 0
+        return window.number
+
+    def _f_winbufnr(self, number):
+        window = self._window(number)
+        return window.buffer.number if window is not None else -1
+
+    def _f_winheight(self, number):
+        window = self._window(number)
+        return window.height if window is not None else -1
+
+    def _f_winlayout(self, tabnr=None):
+        return ['col', [['leaf', window.winid] for window in self.windows]]
+
+    def _f_winnr(self, arg=''):
+        if arg == '$':
+            return len(self.windows)
+        if arg == '#':
+            return self.tab.previous.number
+        return self.tab.current.number
+
+    def _f_winrestcmd(self):
+        return ''.join('%sresize %s|vert %sresize %s|' % (
+            window.number, window.height, window.number, window.width)
+            for window in self.windows)
+
+    def _f_winwidth(self, number):
+        window = self._window(number)
+        return window.width if window is not None else -1
+
+    # -- Commands ----------------------------------------------------------
+
+    def _run(self, line):
+        '''Run an Ex command line, which may hold several "|" separated
+        commands.'''
+        while line is not None:
+            line, rest = self._split_command(line)
+            self._run_one(line)
+            line = rest
+
+    def _split_command(self, line):
+        stripped = line.lstrip(' :')
+        name = re.match(r'(?:silent!?\s+|keepalt\s+|noautocmd\s+)*'
+                        r'\d*\s*(\w*)', stripped).group(1)
+        if name in ('normal', 'norm', 'autocmd', 'au', 'g', 'global'):
+            # These take the rest of the line, bars and all.
+            return line, None
+        quote = None
+        escaped = False
+        for index, char in enumerate(line):
+            if escaped:
+                escaped = False
+            elif quote is not None:
+                if char == '\\' and quote == '"':
+                    escaped = True
+                elif char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char == '|':
+                return line[:index], line[index + 1:]
+        return line, None
+
+    def _run_one(self, line):
+        line = line.strip().lstrip(':').strip()
+        if not line:
+            return
+        silent = False
+        while True:
+            match = re.match(r'(silent!?|keepalt|noautocmd)\s+', line)
+            if match is None:
+                break
+            silent = silent or match.group(1) == 'silent!'
+            line = line[match.end():]
+        count = None
+        match = re.match(r'(\d+)\s*', line)
+        if match is not None:
+            count = int(match.group(1))
+            line = line[match.end():]
+        match = re.match(r'(\w+)(!?)\s*(.*)$', line)
+        if match is None:
+            self.unknown.append(line)
+            return
+        name, bang, args = match.groups()
+        try:
+            self._dispatch(name, bang, args, count)
+        except error:
+            if not silent:
+                raise
+
+    def _dispatch(self, name, bang, args, count):
+        modifiers = []
+        while name in ('vertical', 'vert', 'leftabove', 'aboveleft',
+                       'rightbelow', 'belowright', 'topleft', 'botright'):
+            modifiers.append(name)
+            match = re.match(r'(\d*)\s*([A-Za-z]\w*)(!?)\s*(.*)$', args)
+            if match.group(1):
+                count = int(match.group(1))
+            name, bang, args = match.groups()[1:]
+
+        if name in ('new', 'vnew', 'split', 'sp', 'vsplit', 'vs', 'vne'):
+            return self._c_split(name, args, modifiers)
+        if name in ('resize', 'res'):
+            return self._c_resize(args, count,
+                                  'vertical' in modifiers or 'vert' in modifiers)
+        if name in ('wincmd', 'winc'):
+            return self._c_wincmd(args, count)
+        if name in ('let',):
+            return self._c_let(args)
+        if name in ('unlet', 'unl'):
+            return self._c_unlet(args, bang)
+        if name in ('call', 'cal'):
+            return self._eval(args)
+        if name in ('execute', 'exe', 'exec'):
+            return self._run(' '.join(str(self._eval(part))
+                                      for part in _Parser(self, args, {}).list_args()))
+        if name in ('echo', 'ec'):
+            return self.messages.append(str(self._eval(args)))
+        if name in ('normal', 'norm'):
+            return self._c_normal(args)
+        if name in ('buffer', 'b'):
+            return self._c_buffer(args)
+        if name in ('badd',):
+            return self._find_buffer(args.strip(), create=True)
+        if name in ('edit', 'e'):
+            return self._c_edit(args)
+        if name in ('bdelete', 'bd', 'bwipeout', 'bw'):
+            return self._c_bdelete(args)
+        if name in ('hide', 'hid', 'close', 'clo', 'quit', 'q'):
+            return self._close(self.tab.current)
+        if name in ('only', 'on'):
+            for window in list(self.windows):
+                if window is not self.tab.current:
+                    self._close(window)
+            return
+        if name in ('tabnew', 'tabe', 'tabedit'):
+            return self._c_tabnew(args)
+        if name in ('tabclose', 'tabc'):
+            return self._c_tabclose(args, count)
+        if name in ('tabnext', 'tabn'):
+            return self._c_tabnext(args, count)
+        if name in ('set', 'se', 'setlocal', 'setl'):
+            return self._c_set(args)
+        if name in ('augroup', 'aug'):
+            self.group = None if args.strip() == 'END' else args.strip()
+            return
+        if name in ('autocmd', 'au'):
+            return self._c_autocmd(args, bang)
+        if name in ('sign',):
+            return self._c_sign(args)
+        if name in ('mksession', 'mks'):
+            open(args.strip(), 'w').write('" fake session\n')
+            return
+        if name in ('redraw', 'redr', 'highlight', 'hi', 'syntax', 'sy',
+                    'source', 'so', 'startinsert', 'stopinsert',
+                    'map', 'nmap', 'noremap', 'nnoremap'):
+            return
+        if name in self.user_commands:
+            return self.user_commands[name](args)
+        self.unknown.append(name)
+
+    def _c_split(self, name, args, modifiers):
+        tab = self.tab
+        current = tab.current
+        vertical = name.startswith('v') or 'vertical' in modifiers \
+            or 'vert' in modifiers
+        if args.strip():
+            buffer = self._find_buffer(args.strip(), create=True)
+        elif name in ('new', 'vnew', 'vne'):
+            buffer = self._new_buffer('')
+        else:
+            buffer = current.buffer
+
+        if vertical:
+            width = max(1, (current.width - 1) // 2)
+            current.width -= width + 1
+            window = self._new_window(buffer, width, current.height)
+        else:
+            height = max(1, (current.height - 1) // 2)
+            current.height -= height + 1
+            window = self._new_window(buffer, current.width, height)
+
+        index = tab.windows.index(current)
+        if 'topleft' in modifiers:
+            tab.windows.insert(0, window)
+        elif 'botright' in modifiers:
+            tab.windows.append(window)
+        elif 'leftabove' in modifiers or 'aboveleft' in modifiers:
+            tab.windows.insert(index, window)
+        else:
+            tab.windows.insert(index + 1, window)
+        self._fire('WinNew')
+        self._focus(window)
+
+    def _c_resize(self, args, count, vertical):
+        args = args.strip()
+        window = self.tab.current
+        if count is not None:
+            window = self._window(count) or window
+        attribute = 'width' if vertical else 'height'
+        if not args:
+            value = self.settings['columns' if vertical else 'lines']
+        elif args[0] in '+-':
+            value = getattr(window, attribute) + int(args)
+        else:
+            value = int(args)
+        setattr(window, attribute, max(1, value))
+
+    def _c_wincmd(self, args, count):
+        args = args.strip()
+        if args == 'w':
+            if count is None:
+                index = (self.windows.index(self.tab.current) + 1) % len(self.windows)
+                return self._focus(self.windows[index])
+            window = self._window(min(count, len(self.windows)))
+            return self._focus(window)
+        if args == 'p':
+            return self._focus(self.tab.previous)
+        self.unknown.append('wincmd %s' % args)
+
+    def _c_let(self, args):
+        match = re.match(r'([gwbtv]:\w+)((?:\[[^\]]*\])?)\s*([+\-.]?=)\s*(.*)$', args)
+        if match is None:
+            self.unknown.append('let %s' % args)
+            return
+        name, index, operator, expression = match.groups()
+        value = self._eval(expression)
+        scope, _, key = name.partition(':')
+        values = {'g':self.globals, 'w':self.tab.current.vars,
+                  'b':self.tab.current.buffer.vars, 't':self.tab.vars, 'v':{}}[scope]
+        if index:
+            target = values[key]
+            key = self._eval(index[1:-1])
+            if isinstance(target, dict):
+                key = str(key)
+            values = target
+        if operator == '+=':
+            value = values[key] + value
+        elif operator == '-=':
+            value = values[key] - value
+        elif operator == '.=':
+            value = str(values[key]) + str(value)
+        values[key] = value
+
+    def _c_unlet(self, args, bang):
+        for name in args.split():
+            scope, _, key = name.partition(':')
+            values = {'g':self.globals, 'w':self.tab.current.vars,
+                      'b':self.tab.current.buffer.vars, 't':self.tab.vars}[scope]
+            if key not in values and not bang:
+                raise error('E108: No such variable: %s' % name)
+            values.pop(key, None)
+
+    def _c_normal(self, args):
+        keys = args.lstrip('!').lstrip()
+        window = self.tab.current
+        match = re.match('\x17(\\d*)w$', keys)
+        if match is not None:
+            self._c_wincmd('w', int(match.group(1)) if match.group(1) else None)
+        elif keys == 'G':
+            window._cursor = (len(window.buffer.lines), 0)
+            window.topline = max(1, len(window.buffer.lines) - window.height + 1)
+        elif keys in ('gg', 'z.'):
+            pass
+        else:
+            self.unknown.append('normal %s' % keys)
+
+    def _c_buffer(self, args):
+        buffer = self._find_buffer(args.strip())
+        if buffer is None:
+            raise error('E86: Buffer %s does not exist' % args.strip())
+        self._show(buffer)
+
+    def _show(self, buffer):
+        window = self.tab.current
+        if window.buffer is not buffer:
+            left = window.buffer
+            window.buffer = buffer
+            window._cursor = (1, 0)
+            window.topline = 1
+            self._leave(left)
+            if not buffer.loaded:
+                self._read(buffer)
+            self._fire('BufEnter')
+
+    def _leave(self, buffer):
+        '''Unload a file buffer no window shows any more, unless 'hidden'
+        or its 'bufhidden' keeps it.'''
+        if buffer.options['buftype'] or not buffer.name:
+            return
+        if self.settings['hidden'] or buffer.options['bufhidden'] == 'hide':
+            return
+        for tab in self.tabs:
+            if any(window.buffer is buffer for window in tab.windows):
+                return
+        buffer.lines = ['']
+        buffer.loaded = False
+
+    def _read(self, buffer):
+        '''(Re)load a buffer from its file.'''
+        if os.path.exists(buffer.name):
+            buffer.lines = open(buffer.name).read().splitlines() or ['']
+            self.reads.append(buffer.name)
+        buffer.loaded = True
+
+    def _c_edit(self, args):
+        name = args.strip()
+        buffer = self._find_buffer(name)
+        if buffer is None:
+            buffer = self._new_buffer(name)
+        self._read(buffer)
+        self._show(buffer)
+
+    def _c_bdelete(self, args):
+        buffer = self._find_buffer(args.strip() or '%')
+        if buffer is None:
+            raise error('E516: No buffers were deleted')
+        for window in list(self.windows):
+            if window.buffer is buffer:
+                if len(self.windows) > 1:
+                    self._close(window)
+                else:
+                    window.buffer = self._new_buffer('')
+        buffer.wiped = True
+        self.buffer_list.remove(buffer)
+
+    def _close(self, window):
+        tab = self.tab
+        if len(tab.windows) == 1:
+            raise error('E444: Cannot close last window')
+        index = tab.windows.index(window)
+        tab.windows.remove(window)
+        # The space goes to the neighbour, roughly.
+        neighbour = tab.windows[max(0, index - 1)]
+        neighbour.height += window.height + 1
+        self._fire('WinClosed')
+        if tab.previous is window:
+            tab.previous = neighbour
+        if tab.current is window:
+            tab.current = neighbour
+            self._fire('WinEnter')
+
+    def _c_tabnew(self, args):
+        if args.strip():
+            buffer = self._find_buffer(args.strip(), create=True)
+        else:
+            buffer = self._new_buffer('')
+        window = self._new_window(buffer, self.settings['columns'],
+                                  self.settings['lines'] - 3)
+        tab = Tab(window)
+        self.tabs.insert(self.tabs.index(self.tab) + 1, tab)
+        self.tab = tab
+        self._fire('WinNew')
+        self._fire('TabEnter')
+
+    def _c_tabclose(self, args='', count=None):
+        if len(self.tabs) == 1:
+            raise error('E784: Cannot close last tab page')
+        number = args.strip() or count
+        tab = self.tab
+        if number:
+            tab = self.tabs[min(int(number), len(self.tabs)) - 1]
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        if tab is self.tab:
+            self.tab = self.tabs[max(0, index - 1)]
+            self._fire('TabEnter')
+
+    def _c_tabnext(self, args, count):
+        number = args.strip() or count
+        if number:
+            tab = self.tabs[min(int(number), len(self.tabs)) - 1]
+        else:
+            tab = self.tabs[(self.tabs.index(self.tab) + 1) % len(self.tabs)]
+        if tab is not self.tab:
+            self.tab = tab
+            self._fire('TabEnter')
+
+    def _c_set(self, args):
+        buffer = self.tab.current.buffer
+        for option in args.split():
+            name, _, value = option.partition('=')
+            if name in ('buftype', 'bufhidden'):
+                buffer.options[name] = value
+            elif name in ('hidden', 'nohidden'):
+                self.settings['hidden'] = int(name == 'hidden')
+            else:
+                self.tab.current.options[name] = value
+
+    def _c_autocmd(self, args, bang):
+        if bang:
+            self.autocmds = [autocmd for autocmd in self.autocmds
+                             if autocmd[0] != self.group]
+        match = re.match(r'(\S+)\s+(\S+)\s+(.*)$', args)
+        if match is None:
+            return
+        events, pattern, command_ = match.groups()
+        self.autocmds.append((self.group, events.split(','), pattern,
+                              command_, self.tab.current.buffer))
+
+    def _c_sign(self, args):
+        parts = args.split()
+        action, rest = parts[0], parts[1:]
+        if action == 'define':
+            return
+        options = dict(part.split('=', 1) for part in rest if '=' in part)
+        ids = [part for part in rest if '=' not in part]
+        group = options.get('group', '')
+        if 'file' in options:
+            buffer = self._find_buffer(options['file'])
+        elif 'buffer' in options:
+            buffer = self._find_buffer(options['buffer'])
+        else:
+            buffer = self.tab.current.buffer
+        if action == 'place':
+            if buffer is None:
+                raise error('E158: Invalid buffer name: %s' % options.get('file'))
+            buffer.signs[(group, int(ids[0]))] = (options['name'], int(options['line']))
+        elif action == 'unplace':
+            if ids == ['*']:
+                for buffer in self.buffer_list:
+                    buffer.signs.clear()
+            elif buffer is not None:
+                buffer.signs.pop((group, int(ids[0])), None)
+        elif action == 'jump':
+            if buffer is None or (group, int(ids[0])) not in buffer.signs:
+                raise error('E157: Invalid sign ID: %s' % ids[0])
+            for window in self.windows:
+                if window.buffer is buffer:
+                    self._focus(window)
+                    break
+            else:
+                self._show(buffer)
+            line = buffer.signs[(group, int(ids[0]))][1]
+            self.tab.current._cursor = (line, 0)
+
+
+def _to_vim_result(value):
+    '''Convert a value the way vim.eval() does: numbers become strings.'''
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, long, float)):
+        return str(value)
+    if isinstance(value, list):
+        return [_to_vim_result(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _to_vim_result(item)) for key, item in value.items())
+    if isinstance(value, Lambda):
+        return 'function(\'<lambda>\')'
+    return value
+
+
+class _Parser(object):
+    '''A recursive descent parser for the Vimscript expressions we use.'''
+
+    token_pattern = re.compile(r'''
+        \s*(?:
+            (?P<number>\d+\.\d+|\d+)
+          | (?P<sstring>'(?:[^']|'')*')
+          | (?P<dstring>"(?:[^"\\]|\\.)*")
+          | (?P<option>&[a-z]+)
+          | (?P<name>[gwbvlsta]:[A-Za-z_][\w#]*|[A-Za-z_][\w#]*)
+          | (?P<op>->|&&|\|\||==[#?]?|!=[#?]?|>=|<=|=~|[-+*/%.!?:()\[\]{},<>])
+        )''', re.VERBOSE)
+
+    def __init__(self, fake, text, local):
+        self.fake = fake
+        self.text = text
+        self.local = local
+        self.tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = self.token_pattern.match(text, position)
+            if match is None or match.end() == position:
+                raise error('E15: Invalid expression: %s' % text)
+            kind = match.lastgroup
+            self.tokens.append((kind, match.group(kind), match.end()))
+            position = match.end()
+        self.index = 0
+
+    def peek(self):
+        if self.index < len(self.tokens):
+            return self.tokens[self.index][1]
+        return None
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, value):
+        if self.peek() != value:
+            raise error('E15: Invalid expression: %s' % self.text)
+        if value is not None:
+            self.index += 1
+
+    def list_args(self):
+        '''Space separated expressions, as given to :execute.'''
+        start = 0
+        parts = []
+        while self.peek() is not None:
+            self.expression()
+            end = self.tokens[self.index - 1][2]
+            parts.append(self.text[start:end])
+            start = end
+        return parts
+
+    def expression(self):
+        condition = self.logical_or()
+        if self.peek() == '?':
+            self.next()
+            yes = self.expression()
+            self.expect(':')
+            no = self.expression()
+            return yes if _truthy(condition) else no
+        return condition
+
+    def logical_or(self):
+        value = self.logical_and()
+        while self.peek() == '||':
+            self.next()
+            other = self.logical_and()
+            value = int(_truthy(value) or _truthy(other))
+        return value
+
+    def logical_and(self):
+        value = self.comparison()
+        while self.peek() == '&&':
+            self.next()
+            other = self.comparison()
+            value = int(_truthy(value) and _truthy(other))
+        return value
+
+    def comparison(self):
+        value = self.additive()
+        operator = self.peek()
+        if operator is not None and operator.rstrip('#?') in (
+                '==', '!=', '>', '<', '>=', '<=', '=~'):
+            self.next()
+            other = self.additive()
+            operator = operator.rstrip('#?')
+            if operator == '=~':
+                return int(re.search(other, str(value)) is not None)
+            if isinstance(value, str) != isinstance(other, str):
+                value, other = _number(value), _number(other)
+            return int({
+                '==':value == other, '!=':value != other,
+                '>':value > other, '<':value < other,
+                '>=':value >= other, '<=':value <= other,
+            }[operator])
+        return value
+
+    def additive(self):
+        value = self.multiplicative()
+        while self.peek() in ('+', '-', '.'):
+            operator = self.next()[1]
+            other = self.multiplicative()
+            if operator == '.':
+                value = str(value) + str(other)
+            elif operator == '+' and isinstance(value, list):
+                value = value + other
+            elif operator == '+':
+                value = _number(value) + _number(other)
+            else:
+                value = _number(value) - _number(other)
+        return value
+
+    def multiplicative(self):
+        value = self.unary()
+        while self.peek() in ('*', '/', '%'):
+            operator = self.next()[1]
+            other = _number(self.unary())
+            value = _number(value)
+            if operator == '*':
+                value = value * other
+            elif operator == '/':
+                value = value / other
+            else:
+                value = value % other
+        return value
+
+    def unary(self):
+        if self.peek() == '!':
+            self.next()
+            return int(not _truthy(self.unary()))
+        if self.peek() == '-':
+            self.next()
+            return -_number(self.unary())
+        return self.postfix()
+
+    def postfix(self):
+        value = self.primary()
+        while self.peek() == '[':
+            self.next()
+            if self.peek() == ':':
+                first = 0
+            else:
+                first = self.expression()
+            if self.peek() == ':':
+                self.next()
+                last = None if self.peek() == ']' else self.expression()
+                self.expect(']')
+                last = len(value) if last is None else _number(last) + 1
+                value = value[_number(first):last]
+                continue
+            self.expect(']')
+            if isinstance(value, dict):
+                if str(first) not in value and first not in value:
+                    raise error('E716: Key not present in Dictionary: %s' % first)
+                value = value.get(first, value.get(str(first)))
+            else:
+                value = value[_number(first)]
+        return value
+
+    def arguments(self):
+        self.expect('(')
+        args = []
+        while self.peek() != ')':
+            args.append(self.expression())
+            if self.peek() == ',':
+                self.next()
+        self.expect(')')
+        return args
+
+    def primary(self):
+        kind, value, end = self.next()
+        if kind == 'number':
+            return float(value) if '.' in value else int(value)
+        if kind == 'sstring':
+            return value[1:-1].replace("''", "'")
+        if kind == 'dstring':
+            return _unescape(value[1:-1])
+        if kind == 'option':
+            return self.fake.settings.get(value[1:], 0)
+        if kind == 'name':
+            if self.peek() == '(' and ':' not in value:
+                return self.fake._call(value, self.arguments())
+            return self.fake._variable(value, self.local)
+        if value == '(':
+            result = self.expression()
+            self.expect(')')
+            return result
+        if value == '[':
+            items = []
+            while self.peek() != ']':
+                items.append(self.expression())
+                if self.peek() == ',':
+                    self.next()
+            self.expect(']')
+            return items
+        if value == '{':
+            if self.peek() == '->':
+                return self.lambda_(end)
+            items = {}
+            while self.peek() != '}':
+                key = self.expression()
+                self.expect(':')
+                items[str(key)] = self.expression()
+                if self.peek() == ',':
+                    self.next()
+            self.expect('}')
+            return items
+        raise error('E15: Invalid expression: %s' % self.text)
+
+    def lambda_(self, start):
+        depth = 1
+        while depth:
+            value = self.next()[1]
+            if value == '{':
+                depth += 1
+            elif value == '}':
+                depth -= 1
+        return Lambda(self.text[start:self.tokens[self.index - 1][2] - 1])
+
+
+def _number(value):
+    if isinstance(value, (int, long, float)):
+        return value
+    match = re.match(r'\s*-?\d+', str(value))
+    return int(match.group()) if match else 0
+
+def _truthy(value):
+    return bool(_number(value))
+
+def _unescape(text):
+    '''Handle the backslash escapes of a double quoted vim string.'''
+    keys = {'<C-W>':'\x17', '<CR>':'\r', '<Esc>':'\x1b'}
+    def replace(match):
+        escape = match.group(1)
+        if escape.startswith('<'):
+            return keys.get(escape, escape)
+        return {'n':'\n', 't':'\t', 'r':'\r', 'e':'\x1b'}.get(escape, escape)
+    return re.sub(r'\\(<[^>]+>|.)', replace, text)
+
+def install(**kwargs):
+    '''Create a :class:`FakeVim` and install it as the `vim` module. This
+    has to happen before anything imports vim.
+
+    Modules keep the `vim` they imported, so if a fake is already installed
+    it is started over in place rather than replaced. Everything that
+    imported it then sees the new state.
+
+    :param kwargs:
+        Passed on to :class:`FakeVim`.
+
+    :returns:
+        The :class:`FakeVim` instance.
+    '''
+    fake = sys.modules.get('vim')
+    if isinstance(fake, FakeVim):
+        fake.__init__(**kwargs)
+        return fake
+    fake = FakeVim(**kwargs)
+    sys.modules['vim'] = fake
+    return fake
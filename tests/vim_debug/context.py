@@ -0,0 +1,152 @@
+# coding: utf-8
+'''
+    tests.vim_debug.context
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+from xml.dom import minidom
+
+from attest import Tests
+
+from tests import fakevim
+
+# vim_debug imports vim as it loads.
+fakevim.install()
+from vim_debug.context import ContextCache, PropertyTree
+
+
+# Our test object
+context_test = Tests()
+
+#: A context_names response with two cached contexts, like xdebug's.
+NAMES = minidom.parseString(
+    '<response command="context_names" transaction_id="2">'
+    '<context name="Locals" id="0"/>'
+    '<context name="Globals" id="1"/>'
+    '<context name="Superglobals" id="2"/>'
+    '</response>').documentElement
+
+def named_cache(refresh_every=3):
+    '''A cache that has read :data:`NAMES`.'''
+    cache = ContextCache(refresh_every)
+    cache.set_names(NAMES)
+    return cache
+
+def fetch(cache, cids):
+    '''Store an answer for each of cids, as the context_get handler does.'''
+    for cid in cids:
+        cache.update(cid, [('a', str(cid), 'int', 0)])
+
+@context_test.test
+def names():
+    '''The context names replace the default Locals.'''
+    cache = named_cache()
+
+    assert cache.ids() == [0, 1, 2]
+    assert cache.cached_ids() == [1, 2]
+    assert cache.names[2] == 'Superglobals'
+
+@context_test.test
+def cached_names():
+    '''Names kept by the capability cache have their ids as strings.'''
+    cache = ContextCache()
+    cache.use_names({'0':'Locals', '1':'Globals'})
+
+    assert cache.ids() == [0, 1]
+    assert cache.step() == [1]
+
+@context_test.test
+def first_step():
+    '''Every cached context is fetched on the first step.'''
+    cache = named_cache()
+
+    assert cache.step() == [1, 2]
+
+@context_test.test
+def refresh_every():
+    '''A fetched context is fetched again after refresh_every steps.'''
+    cache = named_cache(refresh_every=3)
+    fetch(cache, cache.step())
+
+    assert cache.step() == []
+    assert cache.step() == []
+    stale = cache.step()
+    assert stale == [1, 2]
+    fetch(cache, stale)
+    assert cache.step() == []
+
+@context_test.test
+def invalidate():
+    '''An invalidated context is fetched on the next step, whatever its
+    age.'''
+    cache = named_cache()
+    fetch(cache, cache.step())
+
+    cache.invalidate(2)
+    assert cache.step() == [2]
+    fetch(cache, [2])
+
+    cache.invalidate()
+    stale = cache.step()
+    assert stale == [1, 2]
+    fetch(cache, stale)
+    assert cache.step() == []
+
+@context_test.test
+def changed():
+    '''Only the values that differ from the last snapshot are changed.'''
+    cache = ContextCache()
+    cache.update(0, [('a', '1', 'int', 0), ('b', '2', 'int', 0)])
+
+    assert not cache.is_changed(0, 'a')
+    assert not cache.is_changed(0, 'b')
+
+    cache.update(0, [('a', '1', 'int', 0), ('b', '3', 'int', 0)])
+    assert not cache.is_changed(0, 'a')
+    assert cache.is_changed(0, 'b')
+
+class Backend(object):
+    '''Records the commands sent, and answers each property_get with
+    children named after its context.'''
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.sent = []
+        self.answers = []
+
+    def command(self, cmd, *args, **kwargs):
+        self.sent.append((cmd,) + args)
+        options = dict(zip(args[::2], args[1::2]))
+        self.answers.append(minidom.parseString(
+            '<response command="property_get" transaction_id="%d">'
+            '<property fullname="%s" children="1" numchildren="1">'
+            '<property fullname="%s.x" type="int">%s</property>'
+            '</property></response>'
+            % (len(self.sent), options['n'], options['n'], options['c'])
+        ).documentElement)
+        return len(self.sent)
+
+    def get_packets(self):
+        for answer in self.answers:
+            assert self.tree.handle(answer)
+        self.answers = []
+
+@context_test.test
+def tree_contexts():
+    '''Children are asked for in their own context, and kept apart from
+    those of a property of the same name in another context.'''
+    tree = PropertyTree()
+    bend = Backend(tree)
+
+    tree.fetch(bend, 0, 'a', frame=2)
+    tree.fetch(bend, 1, 'a', frame=2)
+
+    assert bend.sent == [('property_get', 'd', 2, 'c', 0, 'n', 'a'),
+                         ('property_get', 'd', 2, 'c', 1, 'n', 'a')]
+    assert tree.get(0, 'a') == [('a.x', '0', 'int', 0)]
+    assert tree.get(1, 'a') == [('a.x', '1', 'int', 0)]
+
+    tree.new_pause()
+    assert tree.get(0, 'a') is None
@@ -0,0 +1,70 @@
+# coding: utf-8
+'''
+    tests.vim_debug.packets
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+from attest import Tests, raises
+
+from tests import fakevim
+
+# vim_debug imports vim as it loads.
+fakevim.install()
+from vim_debug.dbgp import PacketSocket
+
+
+# Our test object
+packets_test = Tests()
+
+def frame(body):
+    '''A DBGp frame for body.'''
+    return '%d\0%s\0' % (len(body), body)
+
+class Socket(object):
+    '''Hands out the given pieces, one per recv(); a KeyboardInterrupt
+    piece is raised instead, as Ctrl-C would be.'''
+
+    def __init__(self, pieces):
+        self.pieces = list(pieces)
+
+    def recv(self, size):
+        piece = self.pieces.pop(0)
+        if piece is KeyboardInterrupt:
+            raise KeyboardInterrupt
+        return piece
+
+def packet_socket(pieces):
+    sock = PacketSocket({})
+    sock.sock = Socket(pieces)
+    return sock
+
+@packets_test.test
+def whole_frames():
+    '''Frames arriving together are read one at a time.'''
+    sock = packet_socket([frame('<a/>') + frame('<b x="1"/>')])
+
+    assert sock.read_packet().tagName == 'a'
+    assert sock.last_body == '<a/>'
+    assert sock.read_packet().getAttribute('x') == '1'
+
+@packets_test.test
+def split_frame():
+    '''A frame can arrive a few bytes at a time.'''
+    data = frame('<response transaction_id="3"/>')
+    sock = packet_socket([data[:1], data[1:5], data[5:-1], data[-1:]])
+
+    assert sock.read_packet().getAttribute('transaction_id') == '3'
+
+@packets_test.test
+def interrupted():
+    '''A read broken off in the middle of a frame carries on with the
+    rest of it.'''
+    data = frame('<response transaction_id="4"/>') + frame('<next/>')
+    sock = packet_socket([data[:12], KeyboardInterrupt, data[12:]])
+
+    with raises(KeyboardInterrupt):
+        sock.read_packet()
+    assert sock.read_packet().getAttribute('transaction_id') == '4'
+    assert sock.read_packet().tagName == 'next'
@@ -0,0 +1,60 @@
+# coding: utf-8
+'''
+    tests.vim_debug.scope
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+from attest import Tests
+
+from tests import fakevim
+
+# vim_debug imports vim as it loads.
+fakevim.install()
+from vim_debug.context import ContextCache
+from vim_debug.subwindows import ScopeWindow
+
+
+# Our test object
+scope_test = Tests()
+
+class Tree(object):
+    '''The children fetched so far, as PropertyTree.get gives them.'''
+
+    def __init__(self, children):
+        self.children = children
+
+    def get(self, cid, name):
+        return self.children.get((cid, name))
+
+#: A dict with a fetched child list, which has unfetched children of its own.
+PROPS = [('a', '1', 'int', 0), ('obj', '', 'dict', 2), ('z', '2', 'int', 0)]
+TREE = Tree({(0, 'obj'):[('obj.x', '5', 'int', 0), ('obj.y', '', 'list', 3)]})
+
+@scope_test.test
+def fold_levels():
+    '''Each property with children starts a fold one level deeper than
+    its own, and the next line at its level or above ends it.'''
+    scope = ScopeWindow()
+    entries, names, folds = [], [], []
+    scope.add_rows(entries, names, folds, 0, PROPS, TREE, 0)
+
+    assert [entry[1] if isinstance(entry, list) else entry.strip()
+            for entry in entries] == [
+        'a', 'obj', 'obj.x', 'obj.y', '... 3 children', 'z']
+    assert folds == ['0', '>1', '1', '>2', '2', '0']
+
+@scope_test.test
+def folds_without_text():
+    '''The folds reach vim whole, so they don't depend on which lines have
+    been filled in.'''
+    fakevim.install()
+    scope = ScopeWindow()
+    contexts = ContextCache()
+    contexts.update(0, PROPS)
+    scope.refresh(contexts, TREE)
+
+    assert scope.buffer.vars['vim_debug_folds'] == [
+        '0', '0', '>1', '1', '>2', '2', '0']
+    assert not [row for row in scope.rows if '{{{' in row or '}}}' in row]
@@ -0,0 +1,90 @@
+# coding: utf-8
+'''
+    tests.vim_debug.signs
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+from attest import Tests, raises
+
+from tests import fakevim
+
+# vim_debug imports vim as it loads.
+fakevim.install()
+from vim_debug.signs import SignManager
+
+
+# Our test object
+signs_test = Tests()
+
+#: The functions an older vim, without the sign list functions, lacks.
+NO_LISTS = ('sign_placelist', 'sign_unplacelist')
+
+def editing(*missing):
+    '''A fresh fake vim without missing, editing /src/a.py.'''
+    fake = fakevim.install(missing=missing)
+    fake.command('edit /src/a.py')
+    return fake, fake.current.buffer
+
+def placed(buffer):
+    '''The signs in buffer, as {id: (name, line)}.'''
+    return dict((id, sign) for (group, id), sign in buffer.signs.items())
+
+@signs_test.test
+def sign_lists():
+    '''Signs go through sign_placelist/sign_unplacelist where vim has
+    them.'''
+    fake, buffer = editing()
+    signs = SignManager()
+    signs.want('current', 'current', '/src/a.py', 3)
+    signs.apply()
+
+    assert placed(buffer) == {1:('current', 3)}
+    assert fake.messages == []
+
+@signs_test.test
+def fallback():
+    '''Without the list functions, signs are placed, moved and removed
+    with :sign commands.'''
+    fake, buffer = editing(*NO_LISTS)
+    signs = SignManager()
+    assert not signs.has_lists
+
+    signs.want('current', 'current', '/src/a.py', 3)
+    signs.want(('break', 1), 'breakpt', '/src/a.py', 7)
+    signs.apply()
+    assert sorted(placed(buffer).values()) == [('breakpt', 7), ('current', 3)]
+
+    signs.want('current', 'current', '/src/a.py', 4)
+    signs.drop(('break', 1))
+    signs.apply()
+    assert placed(buffer).values() == [('current', 4)]
+    assert fake.unknown == []
+
+@signs_test.test
+def fallback_without_execute():
+    '''A vim without execute() gets the :sign commands joined with |.'''
+    fake, buffer = editing('execute', *NO_LISTS)
+    signs = SignManager()
+    signs.want('current', 'current', '/src/a.py', 3)
+    signs.apply()
+
+    assert placed(buffer).values() == [('current', 3)]
+
+@signs_test.test
+def failed_send():
+    '''Signs vim refused are not recorded as placed, and their ids go
+    back to the pool.'''
+    fake, buffer = editing(*NO_LISTS)
+    signs = SignManager()
+    signs.want('current', 'current', '/src/missing.py', 3)
+
+    with raises(fakevim.error):
+        signs.apply()
+    assert signs.placed == {}
+
+    signs.clear()
+    signs.want('current', 'current', '/src/a.py', 3)
+    signs.apply()
+    assert placed(buffer) == {1:('current', 3)}
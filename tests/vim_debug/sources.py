@@ -0,0 +1,74 @@
+# coding: utf-8
+'''
+    tests.vim_debug.sources
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+import os
+import shutil
+import tempfile
+
+from attest import Tests
+
+from tests import fakevim
+
+# vim_debug imports vim as it loads.
+fakevim.install()
+from vim_debug.sources import SourceBuffers
+
+
+# Our test object
+sources_test = Tests()
+
+@sources_test.context
+def files():
+    '''A fresh fake vim *(with the default 'nohidden')* and two source
+    files.'''
+    fake = fakevim.install()
+    directory = tempfile.mkdtemp()
+    paths = []
+    for name in ('a.py', 'b.py'):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as source:
+            source.write('# %s\nx = 1\n' % name)
+        paths.append(path)
+    try:
+        yield fake, paths[0], paths[1]
+    finally:
+        shutil.rmtree(directory)
+
+@sources_test.test
+def no_reload(fake, a, b):
+    '''Going back to a file shows its buffer without reading it again.'''
+    sources = SourceBuffers()
+    sources.show(a)
+    sources.show(b)
+    sources.show(a)
+
+    assert fake.reads == [a, b]
+    assert fake.current.buffer.name == a
+    assert fake.current.buffer[:] == ['# a.py', 'x = 1']
+
+@sources_test.test
+def changed_file(fake, a, b):
+    '''A file changed on disk is read again.'''
+    sources = SourceBuffers()
+    sources.show(a)
+    sources.show(b)
+    os.utime(a, (0, 0))
+    sources.show(a)
+
+    assert fake.reads == [a, b, a]
+
+@sources_test.test
+def dropped_file(fake, a, b):
+    '''A file that drops out of the list gets its bufhidden back.'''
+    sources = SourceBuffers(size=1)
+    sources.show(a)
+    buffer = fake.current.buffer
+    assert buffer.options['bufhidden'] == 'hide'
+
+    sources.show(b)
+    assert buffer.options['bufhidden'] == ''
@@ -0,0 +1,44 @@
+'''lays variables out in columns: name = value /* type: t */
+
+The widths come from the rows themselves and from the width of the
+window, and are worked out once for the whole list, so the names, values
+and types line up however long the names are.'''
+
+def fit(text, width):
+    '''text, cut to width with "..." marking the cut'''
+    if len(text) <= width:
+        return text
+    if width <= 3:
+        return text[:width]
+    return text[:width - 3] + '...'
+
+def columns(entries, width, min_value=8):
+    '''the lines for entries, all in one pass.
+
+    An entry is either a line to use as it is (a header, say) or a list of
+    [lead, name, value, type, tail]; lead (change mark, indent) goes
+    before the name and tail after the type. Names get at most a third of
+    the width and values what is left; both are cut to fit, values to no
+    less than min_value.'''
+    props = list(entry for entry in entries if not isinstance(entry, basestring))
+    if not props:
+        return list(entries)
+    name_w = min(max(len(lead) + len(name) for lead, name, value, type, tail in props),
+                 max(width // 3, 10))
+    type_w = max(len(type) for lead, name, value, type, tail in props)
+    tail_w = max(len(tail) for lead, name, value, type, tail in props)
+    room = width - name_w - type_w - tail_w - len(' =  /* type:  */') - 1
+    value_w = max(min(max(len(value) for lead, name, value, type, tail in props), room),
+                  min_value)
+    lines = []
+    for entry in entries:
+        if isinstance(entry, basestring):
+            lines.append(entry)
+            continue
+        lead, name, value, type, tail = entry
+        lines.append('%s = %s /* type: %s */%s' % (fit(lead + name, name_w).ljust(name_w),
+                                                   fit(value, value_w).ljust(value_w),
+                                                   type, tail))
+    return lines
+
+# vim: et sw=4 sts=4
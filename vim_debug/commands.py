@@ -4,6 +4,7 @@ import vim
 import socket
 import traceback
 from new_debugger import Debugger
+import snapshot
 
 import shlex
 
@@ -14,6 +15,15 @@ def get_vim(name, default, fn=str):
 
 _old_commands = _commands = {}
 def debugger_cmd(plain):
+    '''one :Dbg command; vim state is read at most once per layout change
+    while it runs (see snapshot)'''
+    snapshot.begin()
+    try:
+        run_cmd(plain)
+    finally:
+        snapshot.end()
+
+def run_cmd(plain):
     global _commands, debugger
     if not _commands:
         return start(*shlex.split(plain))
@@ -37,11 +47,15 @@ def debugger_cmd(plain):
     try:
         if not callable(cmd['function']):
             if debugger.bend.connected():
-                    debugger.bend.command(cmd['function'])
+                    debugger.resume(cmd['function'])
+        elif debugger.busy() and not cmd['options'].get('running', False):
+            print 'the program is running; `%s` has to wait for it to stop' % name
         elif cmd['options'].get('plain', False):
             cmd['function'](plain)
         else:
             cmd['function'](*args)
+        if name != 'quit' and debugger is not None and debugger.started:
+            debugger.redraw()
     except (EOFError, socket.error):
         if debugger is not None:
             debugger.disable()
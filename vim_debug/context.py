@@ -0,0 +1,149 @@
+import base64
+
+from subwindows import get_child_text
+
+def get_properties(node):
+    '''turn the <property> children of a context_get response (or of a
+    property) into (name, value, type, number of children) tuples; only
+    the direct children, their own children are left for PropertyTree'''
+    props = []
+    for child in node.childNodes:
+        if getattr(child, 'tagName', None) != 'property':
+            continue
+        name = child.getAttribute('fullname')
+        type = child.getAttribute('type')
+        if not name:
+            text = get_child_text(child, 'value')
+            name = get_child_text(child, 'fullname')
+        else:
+            if not child.firstChild:
+                text = ''
+            elif hasattr(child.firstChild, 'data'):
+                text = child.firstChild.data
+            else:
+                text = ''
+            if child.hasAttribute('encoding') and child.getAttribute('encoding') == 'base64':
+                text = base64.decodestring(text)
+        count = 0
+        if child.getAttribute('children') == '1':
+            count = int(child.getAttribute('numchildren') or 1)
+        props.append((name, text, type, count))
+    return props
+
+class ContextCache:
+    '''Keeps a snapshot of every context the engine knows about.
+
+    Locals (context 0) are fetched on every step; the other contexts
+    (globals, superglobals...) are only fetched again when they have been
+    invalidated or have been cached for `refresh_every` steps.'''
+
+    LOCAL = 0
+
+    def __init__(self, refresh_every=10):
+        self.refresh_every = refresh_every
+        self.names = {self.LOCAL:'Locals'}
+        self.snapshots = {}
+        self.changed = {}
+        self.age = {}
+
+    def set_names(self, node):
+        '''read the response of context_names (called once per session)'''
+        names = {}
+        for item in node.getElementsByTagName('context'):
+            names[int(item.getAttribute('id'))] = item.getAttribute('name')
+        self.use_names(names)
+
+    def use_names(self, names):
+        '''take the contexts as an id -> name dict, as set_names reads them
+        or as the capability cache kept them (with the ids as strings)'''
+        self.names = dict((int(cid), name) for cid, name in names.iteritems())
+        if not self.names:
+            self.names[self.LOCAL] = 'Locals'
+        self.invalidate()
+
+    def ids(self):
+        return sorted(self.names.keys())
+
+    def cached_ids(self):
+        return list(cid for cid in self.ids() if cid != self.LOCAL)
+
+    def step(self):
+        '''age the cached contexts by one step; returns the ids that need
+        to be fetched again'''
+        stale = []
+        for cid in self.cached_ids():
+            age = self.age.get(cid)
+            if age is None:
+                # never fetched, or invalidated
+                stale.append(cid)
+                continue
+            self.age[cid] = age + 1
+            if self.age[cid] >= self.refresh_every:
+                stale.append(cid)
+        return stale
+
+    def invalidate(self, cid=None):
+        '''force the next step to fetch `cid` again (or every cached context)'''
+        if cid is None:
+            for cid in self.cached_ids():
+                self.age[cid] = None
+        else:
+            self.age[cid] = None
+
+    def update(self, cid, properties):
+        '''store a fresh snapshot, marking the values that changed since the
+        last one'''
+        old = dict((prop[0], prop[1:3]) for prop in self.snapshots.get(cid, ()))
+        if cid in self.snapshots:
+            self.changed[cid] = set(prop[0] for prop in properties
+                                    if old.get(prop[0]) != prop[1:3])
+        else:
+            self.changed[cid] = set()
+        self.snapshots[cid] = properties
+        self.age[cid] = 0
+
+    def properties(self, cid):
+        return self.snapshots.get(cid, [])
+
+    def is_changed(self, cid, name):
+        return name in self.changed.get(cid, ())
+
+class PropertyTree:
+    '''The children of expandable properties, by (context id, full name).
+    A local and a global of the same name are different properties.
+
+    Children are only asked for (property_get) the first time the fold of
+    their parent is opened, and kept until the engine moves on, so closing
+    the fold and opening it again doesn't go back to the engine.'''
+
+    def __init__(self):
+        self.children = {}
+        self.pending = {}
+
+    def new_pause(self):
+        self.children.clear()
+        self.pending.clear()
+
+    def get(self, cid, name):
+        return self.children.get((cid, name))
+
+    def fetch(self, bend, cid, name, frame=0):
+        tid = bend.command('property_get', 'd', frame, 'c', cid, 'n', name, suppress=True)
+        self.pending[tid] = cid, name
+        bend.get_packets()
+
+    def handle(self, node):
+        '''consume a property_get response; returns False if the response
+        wasn't one of ours'''
+        tid = int(node.getAttribute('transaction_id'))
+        if tid not in self.pending:
+            return False
+        key = self.pending.pop(tid)
+        self.children[key] = []
+        for child in node.childNodes:
+            if getattr(child, 'tagName', None) == 'property':
+                self.children[key] = get_properties(child)
+                break
+        return True
+
+# vim: et sw=4 sts=4
@@ -1,11 +1,12 @@
 
+import Queue
 import socket
 import base64
 import xml.dom.minidom
 
 class DBGP:
     """ DBGp Procotol class """
-    def __init__(self, options, log=lambda text:None, type=None):
+    def __init__(self, options, log=lambda direction, frame:None, type=None):
         self.sock = PacketSocket(options)
         self.cid = 0
         self.received = 0
@@ -15,6 +16,7 @@ class DBGP:
         self.close = self.sock.close
         self.log = log
         self._type = type
+        self.queue = None   # set by a running Pump
 
     def connected(self):
         return self.sock.connected
@@ -31,7 +33,7 @@ class DBGP:
         else:
             b64data = ''
         cmd = tpl % (cmd, self.cid, str_args, b64data)
-        self.log('SEND: %s' % cmd)
+        self.log('send', cmd)
         self.sock.send(cmd)
         if not kargs.get('suppress', False):
             self.get_packets()
@@ -40,45 +42,66 @@ class DBGP:
     def get_packets(self, force=0):
         while self.received < self.cid or force > 0:
             force -= 1
+            if self.queue is not None:
+                # a Pump is reading the socket; wait in short slices, as
+                # a wait without a timeout can't be broken with Ctrl-C
+                try:
+                    item = self.queue.get(timeout=0.1)
+                except Queue.Empty:
+                    force += 1
+                    continue
+                if item is None:
+                    raise EOFError, 'Socket Closed'
+                self.dispatch(*item)
+                continue
             if not self.sock.sock:
                 return
             packet = self.sock.read_packet()
-            # print 'packet:', self.received, self.cid
-            # print packet.toprettyxml(indent='   ')
-            self.log('RECV: %s' % packet.toprettyxml(indent='   '))
-            if packet.tagName == 'response':
-                if packet.getAttribute('transaction_id') == '':
-                    self.handlers['error'](packet.firstChild)
-                    continue
-                id = int(packet.getAttribute('transaction_id'))
-                if id > self.received:
-                    self.received = id
-                else:
-                    print 'weird -- received is greater than the id I just got: %d %d' % (self.received, id)
-                cmd = packet.getAttribute('command')
-                if cmd in self.handlers:
-                    self.handlers[cmd](packet)
-                else:
-                    raise TypeError('invalid packet type:', cmd)
-            elif packet.tagName == 'stream':
-                if '<stream>' in self.handlers and packet.firstChild is not None:
-                    text = base64.decodestring(packet.firstChild.data)
-                    self.handlers['<stream>'](packet.getAttribute('type'), text)
-            elif packet.tagName == 'init':
-                self.handlers['<init>'](packet)
+            self.dispatch(packet, self.sock.last_body)
+
+    def dispatch(self, packet, raw):
+        '''hand a parsed packet to its handler; raw is the xml it was parsed
+        from, and its size is left on the packet as packet.length'''
+        packet.length = len(raw)
+        # print 'packet:', self.received, self.cid
+        # print packet.toprettyxml(indent='   ')
+        self.log('recv', raw)
+        if packet.tagName == 'response':
+            if packet.getAttribute('transaction_id') == '':
+                self.handlers['error'](packet.firstChild)
+                return
+            id = int(packet.getAttribute('transaction_id'))
+            if id > self.received:
+                self.received = id
             else:
-                print 'tagname', packet.tagName
+                print 'weird -- received is greater than the id I just got: %d %d' % (self.received, id)
+            cmd = packet.getAttribute('command')
+            if cmd in self.handlers:
+                self.handlers[cmd](packet)
+            else:
+                raise TypeError('invalid packet type:', cmd)
+        elif packet.tagName == 'stream':
+            if '<stream>' in self.handlers and packet.firstChild is not None:
+                text = base64.decodestring(packet.firstChild.data)
+                self.handlers['<stream>'](packet.getAttribute('type'), text)
+        elif packet.tagName == 'init':
+            self.handlers['<init>'](packet)
+        else:
+            print 'tagname', packet.tagName
 
 class PacketSocket:
     def __init__(self, options):
         self.options = options
         self.sock = None
         self.connected = False
+        self.last_body = ''
+        self.data = ''
 
     def accept(self):
         # print 'waiting for a new connection on port %d for %d seconds...' % (self.options.get('port', 9000),
         #                                                                      self.options.get('wait', 5))
         self.connected = False
+        self.data = ''
         serv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         socket.setdefaulttimeout(5)
         serv.settimeout(5)
@@ -103,53 +126,35 @@ class PacketSocket:
             self.sock = None
         self.connected = False
 
-    def read(self, size):
-        '''main receiving class...'''
-        text = ''
-        while size > 0:
-            buf = self.sock.recv(size)
-            if buf == '':
-                self.close()
-                raise EOFError, 'Socket Closed'
-            text += buf
-            size -= len(buf)
-        return text
+    def read_packet(self):
+        '''read a packet from the server and return the xml tree
 
-    def read_number(self):
-        length = ''
+        Whatever arrives is kept in self.data until a whole frame (length,
+        null, body, null) is in, and the frame only leaves it in one go. So
+        a read that Ctrl-C breaks off carries on where it stopped the next
+        time, rather than starting in the middle of a frame.'''
         while 1:
+            end = self.data.find('\0')
+            if end >= 0:
+                length = int(self.data[:end])
+                start = end + 1
+                if len(self.data) > start + length:
+                    body = self.data[start:start + length]
+                    if self.data[start + length] != '\0':
+                        raise Exception('invalid response from debug server')
+                    self.data = self.data[start + length + 1:]
+                    self.last_body = body
+                    return xml.dom.minidom.parseString(body).firstChild
             if not self.sock:
                 raise EOFError, 'Socket Closed'
-            c = self.sock.recv(1)
-            if c == '':
-                self.close()
-                raise EOFError, 'Socket Closed'
-            if c == '\0':
-                return int(length)
-            if c.isdigit():
-                length += c
+            self.data += self.recv()
 
-    def read_null(self):
-        '''read a null byte'''
-        c = self.sock.recv(1)
-        if c != '\0':
-            raise Exception('invalid response from debug server')
-        '''
-        while 1:
-            c = self.sock.recv(1)
-            if c == '':
-                self.close()
-                raise EOFError, 'Socket Closed'
-            if c == '\0':
-                return
-                '''
-
-    def read_packet(self):
-        '''read a packet from the server and return the xml tree'''
-        length = self.read_number()
-        body = self.read(length)
-        self.read_null()
-        return xml.dom.minidom.parseString(body).firstChild
+    def recv(self):
+        buf = self.sock.recv(4096)
+        if buf == '':
+            self.close()
+            raise EOFError, 'Socket Closed'
+        return buf
 
     def send(self, cmd):
         self.sock.send(cmd + '\0')
@@ -0,0 +1,66 @@
+import vim
+
+class FeatureLimits:
+    '''Picks max_children / max_data / max_depth from what the scope and
+    watch panes can actually show.
+
+    The user settings are used as ceilings. max_children follows the
+    height of the scope pane, max_data follows the width of the widest
+    value column and both are scaled down when recent context responses
+    have been larger than `budget` bytes. feature_set is only sent for the
+    values that changed since the last negotiation.'''
+
+    names = ('max_children', 'max_data', 'max_depth')
+    floor = {'max_children':8, 'max_data':64, 'max_depth':1}
+
+    def __init__(self, settings, budget=65536, history=5):
+        self.ceiling = dict((name, int(settings[name])) for name in self.names)
+        self.budget = budget
+        self.history = history
+        self.sizes = []
+        self.sent = {}
+
+    def record(self, size):
+        '''remember the size (in bytes) of a context response'''
+        self.sizes.append(size)
+        del self.sizes[:-self.history]
+
+    def geometry(self, windows):
+        '''(scope height, value width) in one eval'''
+        scope = windows['scope'].name
+        results = windows['watch'].results.name
+        res = vim.eval("[winheight(bufwinnr('%s')), winwidth(bufwinnr('%s')), winwidth(bufwinnr('%s'))]"
+                       % (scope, scope, results))
+        height, width, watch_width = [int(item) for item in res]
+        return height, max(width, watch_width)
+
+    def best(self, windows):
+        height, width = self.geometry(windows)
+        values = {
+            # a couple of screens worth, so scrolling doesn't hit the end
+            'max_children':height * 2,
+            # the value column shares the line with the name and type
+            'max_data':width * 2,
+            'max_depth':self.ceiling['max_depth'],
+        }
+        if self.sizes:
+            average = sum(self.sizes) / len(self.sizes)
+            if average > self.budget:
+                values['max_children'] = values['max_children'] * self.budget / average
+        for name in self.names:
+            values[name] = max(self.floor[name], min(values[name], self.ceiling[name]))
+        return values
+
+    def negotiate(self, bend, windows):
+        '''send feature_set for whichever limits changed; returns the names
+        that were sent'''
+        values = self.best(windows)
+        changed = list(name for name in self.names if self.sent.get(name) != values[name])
+        for name in changed:
+            bend.command('feature_set', 'n', name, 'v', values[name], suppress=True)
+            self.sent[name] = values[name]
+        if changed:
+            bend.get_packets()
+        return changed
+
+# vim: et sw=4 sts=4
@@ -1,4 +1,5 @@
 import subprocess
+import tempfile
 import textwrap
 import socket
 import vim
@@ -6,6 +7,15 @@ import os
 
 from ui import DebugUI
 from dbgp import DBGP
+from context import ContextCache, PropertyTree, get_properties
+from watch import WatchEngine
+from limits import FeatureLimits
+from values import ValueStream
+from scheduler import RedrawScheduler
+from pump import Pump
+from subwindows import get_child_text
+from vimbug.capabilities import CapabilityCache, engine_key
+import stats
 
 def vim_init():
     '''put DBG specific keybindings here -- e.g F1, whatever'''
@@ -66,10 +76,15 @@ class CmdRegistrar(Registrar):
 
 class Debugger:
     ''' This is the main debugger class... '''
-    options = {'port':9000, 'max_children':32, 'max_data':'1024', 'minbufexpl':0, 'max_depth':1}
+    options = {'port':9000, 'max_children':32, 'max_data':'1024', 'minbufexpl':0, 'max_depth':1,
+               'context_refresh':10, 'output_lines':1000}
     def __init__(self):
         self.started = False
-        self.watching = {}
+        self.status = None
+        self.switches_seen = 0
+        self.stream = None
+        self.pump = None
+        self.engine = None
         self._type = None
     
     def init_vim(self):
@@ -77,6 +92,13 @@ class Debugger:
         self.settings = {}
         for k,v in self.options.iteritems():
             self.settings[k] = get_vim(k, v, type(v))
+        self.contexts = ContextCache(int(self.settings['context_refresh']))
+        self.tree = PropertyTree()
+        self.watcher = WatchEngine(self.ui.windows['watch'])
+        self.limits = FeatureLimits(self.settings)
+        self.scheduler = RedrawScheduler(ready=self.ui.in_tab)
+        self.capabilities = CapabilityCache()
+        self.ui.windows['output'].keep = int(self.settings['output_lines'])
         vim_init()
 
     def start_url(self, url):
@@ -120,7 +142,7 @@ class Debugger:
     def start(self):
         ## self.breaks = BreakPointManager()
         self.started = True
-        self.bend = DBGP(self.settings, self.ui.windows['log'].write, self._type)
+        self.bend = DBGP(self.settings, self.ui.windows['log'].record, self._type)
         for key, value in self.handle.bind(self).iteritems():
             if callable(value['function']):
                 fn = value['function']
@@ -130,7 +152,7 @@ class Debugger:
                     tmp = getattr(tmp, item)
                 fn = tmp
             self.bend.addCommandHandler(key, fn)
-        self.bend.addCommandHandler('<stream>', self.ui.windows['output'].add)
+        self.bend.addCommandHandler('<stream>', self._stream)
         if not self.bend.connect():
             print textwrap.dedent('''\
                 Unable to connect to debug server. Things to check:
@@ -149,21 +171,47 @@ class Debugger:
 
         self.bend.get_packets(1)
 
-        self.bend.command('feature_set', 'n', 'max_children', 'v', self.settings['max_children'])
-        self.bend.command('feature_set', 'n', 'max_data', 'v', self.settings['max_data'])
-        self.bend.command('feature_set', 'n', 'max_depth', 'v', self.settings['max_depth'])
+        self.limits.negotiate(self.bend, self.ui.windows)
         self.bend.command('stdout', 'c', '1')
         self.bend.command('stderr', 'c', '1')
-        for name in ('max_children', 'max_data', 'max_depth'):
-            self.bend.command('feature_set', 'n', name, 'v', self.settings[name], suppress=True)
 
+        self.get_context_names()
         self.bend.command('step_into')
-        self.bend.command('context_get')
-        self.bend.command('stack_get')
+        self.get_contexts()
+        self.get_stack()
         self.bend.command('status')
 
+        self.scheduler.flush(force=True)
         self.ui.go_srcview()
 
+        # from here on, run and the steps return straight away and the
+        # engine's answer is picked up by the pump
+        self.pump = Pump(self.bend)
+        self.pump.start()
+
+    def resume(self, command):
+        '''send a run/step command; it only waits for the engine to stop
+        when there is no pump'''
+        running = self.pump is not None and self.pump.running()
+        self.bend.command(command, suppress=running)
+        if running:
+            # until the engine answers, see busy()
+            self.set_status('running')
+
+    def busy(self):
+        '''is the program running? The engine answers nothing but the
+        run/step command then, so a command that waits for an answer
+        would hang vim until the next break'''
+        return self.status == 'running'
+
+    def redraw(self):
+        '''draw whatever changed, unless more steps are already queued; also
+        notes how many focus switches the last command cost'''
+        self.scheduler.flush()
+        switches = stats.get('focus.switches')
+        stats.set('focus.switches.last_command', switches - self.switches_seen)
+        self.switches_seen = switches
+
     def set_status(self, status):
         self.status = status
         # self.party
@@ -181,30 +229,101 @@ class Debugger:
         self.bend.command('eval', data=code)
         self.bend.command('context_get')
 
-    @cmd('quit', 'stop', 'exit', help='exit the debugger')
+    @cmd('globals', help='fetch the cached (non-local) contexts again', lead='g')
+    def globals_(self):
+        self.contexts.invalidate()
+        for cid in self.contexts.step():
+            self.bend.command('context_get', 'c', cid)
+
+    @cmd('open', help='open the full value of a variable in a scratch buffer (Ctrl-C stops it)', plain=True)
+    def open_value(self, name):
+        name = name.strip() or vim.eval('expand("<cword>")')
+        self.ui.go_tab()
+        self.stream = ValueStream(self.ui.windows['value'], name, self._type or 'python',
+                                  self.ui.windows['stack'].at)
+        self.stream.start(self.bend)
+
+    @cmd('stats', help='show how much UI work the session has done', running=True)
+    def stats(self):
+        for line in stats.report():
+            print line
+
+    @cmd('scroll', help='fill in the scope lines that scrolled into view', running=True)
+    def scroll(self):
+        self.ui.windows['scope'].fill()
+
+    @cmd('expand', help='open the fold under the cursor in the scope pane, fetching its children the first time')
+    def expand(self):
+        scope = self.ui.windows['scope']
+        cid, name, count = scope.property_at(vim.current.window.cursor[0])
+        if count and self.tree.get(cid, name) is None:
+            self.tree.fetch(self.bend, cid, name, self.ui.windows['stack'].at)
+            scope.refresh(self.contexts, self.tree)
+        vim.command('silent! normal! zo')
+
+    @cmd('more', help='fetch more stack frames once the end of the stack pane is in view')
+    def more(self):
+        stack = self.ui.windows['stack']
+        if stack.near_end():
+            self.get_frames(stack.loaded + stack.page)
+
+    @cmd('output', help='open everything the program printed this session', running=True)
+    def output(self):
+        self.ui.go_tab()
+        if not self.ui.windows['output'].open_log():
+            print 'nothing has been printed yet'
+
+    @cmd('pump', help='apply debugger events that arrived in the background', running=True)
+    def pump_(self):
+        if self.pump is not None:
+            self.pump.tick()
+
+    @cmd('log', help='show the protocol log (also done when the LOG pane is entered)', running=True)
+    def log(self):
+        self.ui.windows['log'].show()
+
+    @cmd('dumplog', help='write the protocol log to a file', plain=True, running=True)
+    def dumplog(self, path):
+        path = os.path.expanduser(path.strip())
+        if not path:
+            fd, path = tempfile.mkstemp(prefix='vim_debug_protocol.', suffix='.log')
+            os.close(fd)
+        self.ui.windows['log'].dump(path)
+        print 'protocol log written to', path
+
+    @cmd('flush', help='draw any pane updates that were put off', running=True)
+    def flush(self):
+        self.scheduler.flush(force=True)
+
+    @cmd('quit', 'stop', 'exit', help='exit the debugger', running=True)
     def quit(self):
+        self.scheduler.stop()
+        if self.pump is not None:
+            self.pump.stop()
         self.bend.close()
         self.ui.close()
         vim_quit()
 
     @cmd('up', help='go up the stack', lead='u')
     def up(self):
+        self.ui.go_tab()
         self.ui.stack_up()
+        self.watcher.evaluate(self.bend, self.ui.windows['stack'].at)
 
     @cmd('down', help='go down the stack', lead='d')
     def down(self):
+        self.ui.go_tab()
+        stack = self.ui.windows['stack']
+        if stack.row_of(stack.at) >= len(stack.rows) - 2:
+            self.get_frames(stack.loaded + stack.page)
         self.ui.stack_down()
+        self.watcher.evaluate(self.bend, self.ui.windows['stack'].at)
 
     @cmd('watch', help='execute watch functions', lead='w')
     def watch(self):
-        lines = self.ui.windows['watch'].expressions.buffer
-        self.watching = {}
-        for i, line in enumerate(lines[1:]):
-            if not line.strip():continue
-            # self.ui.windows['log'].write('evalling:' + line)
-            tid = self.bend.command('eval', data=line, suppress=True)
-            self.watching[tid] = i+1
-        self.bend.get_packets()
+        self.ui.go_tab()
+        self.watcher.evaluate(self.bend, self.ui.windows['stack'].at)
+        self.ui.windows['watch'].expressions.focus()
 
     @cmd('break', help='set a breakpoint', lead='b')
     def break_(self):
@@ -233,26 +352,48 @@ class Debugger:
         tid = self.bend.cid + 1
         # self.ui.queue_break(tid, file, row)
         self.bend.command('breakpoint_set', 't', 'line', 'r', '1', 'f', 'file://' + file, 'n', row, data='')
-        self.bend.command('run')
+        self.resume('run')
     
     def commands(self):
         self._commands = self.cmd.bind(self)
         return self._commands
 
+    def _stream(self, type, text):
+        output = self.ui.windows['output']
+        output.add(type, text)
+        self.scheduler.mark('output', output.flush)
+
     handle = Registrar()
     @handle('stack_get')
     def _stack_get(self, node):
-        line = self.ui.windows['stack'].refresh(node)
+        '''one frame of a page, or the whole stack; the pane is marked
+        once the lot is in (see get_frames)'''
+        self.ui.windows['stack'].update(node)
+
+    def _draw_stack(self):
+        stack = self.ui.windows['stack']
+        stack.draw()
+        line = stack.frames[stack.at]
         self.ui.set_srcview(line[2], line[3])
 
+    @handle('stack_depth')
+    def _stack_depth(self, node):
+        if node.getElementsByTagName('error') or not node.getAttribute('depth'):
+            # not supported; get_stack falls back to a plain stack_get
+            return
+        stack = self.ui.windows['stack']
+        stack.depth = max(stack.depth, int(node.getAttribute('depth')))
+
     @handle('breakpoint_set')
     def _breakpoint_set(self, node):
         self.ui.set_break(int(node.getAttribute('transaction_id')), node.getAttribute('id'))
+        self.scheduler.mark('signs', self.ui.signs.apply)
         self.ui.go_srcview()
 
     @handle('breakpoint_remove')
     def _breakpoint_remove(self, node):
         self.ui.clear_break(int(node.getAttribute('transaction_id')))
+        self.scheduler.mark('signs', self.ui.signs.apply)
         self.ui.go_srcview()
 
     def _status(self, node):
@@ -264,22 +405,75 @@ class Debugger:
             self.set_status(node.getAttribute('status'))
             if self.status != 'stopping':
                 try:
-                    self.bend.command('context_get')
-                    self.bend.command('stack_get')
+                    if self.ui.in_tab():
+                        # the panes' sizes can only be read in their tab
+                        self.limits.negotiate(self.bend, self.ui.windows)
+                    self.get_contexts()
+                    self.get_stack()
+                    self.watcher.new_pause()
+                    self.tree.new_pause()
+                    self.watcher.evaluate(self.bend)
                 except (EOFError, socket.error):
                     self.disable()
             else:
                 self.disable()
 
+    def get_stack(self):
+        '''the depth of the stack, then its first page of frames'''
+        stack = self.ui.windows['stack']
+        stack.reset()
+        self.bend.command('stack_depth')
+        if not stack.depth:
+            # an engine without stack_depth
+            self.bend.command('stack_get')
+            self.scheduler.mark('stack', self._draw_stack)
+            return
+        self.get_frames(stack.page)
+
+    def get_frames(self, end):
+        '''send a stack_get for each frame above end we don't have yet, all
+        in one batch'''
+        levels = self.ui.windows['stack'].missing(end)
+        for level in levels:
+            self.bend.command('stack_get', 'd', level, suppress=True)
+        if levels:
+            self.bend.get_packets()
+            self.scheduler.mark('stack', self._draw_stack)
+
+    def get_context_names(self):
+        '''the context names only change with the engine, so they come from
+        the capability cache once this engine has been seen'''
+        known = self.engine and self.capabilities.get(self.engine)
+        if known and 'contexts' in known:
+            self.contexts.use_names(known['contexts'])
+            stats.incr('capabilities.cached')
+        else:
+            self.bend.command('context_names')
+
+    def get_contexts(self):
+        '''fetch the locals, plus any cached context that has gone stale'''
+        self.bend.command('context_get')
+        for cid in self.contexts.step():
+            self.bend.command('context_get', 'c', cid)
+
     def disable(self):
         print 'Execution has ended; connection closed. type :Dbg quit to exit debugger'
-        self.ui.unhighlight()
+        self.scheduler.mark('stack', self.ui.unhighlight)
+        self.scheduler.flush(force=True)
+        self.scheduler.stop()
+        if self.pump is not None:
+            self.pump.stop()
+        # flush stays, for what couldn't be drawn outside the debugger's tab
         for cmd in self._commands.keys():
-            if cmd not in ('quit', 'close'):
+            if cmd not in ('quit', 'close', 'flush'):
                 self._commands.pop(cmd)
 
     @handle('<init>')
     def _init(self, node):
+        engine = node.getElementsByTagName('engine')
+        self.engine = engine_key(get_child_text(node, 'engine').strip(),
+                                 engine and engine[0].getAttribute('version'),
+                                 node.getAttribute('language'))
         file = node.getAttribute('fileuri')
         self.ui.set_srcview(file, 1)
 
@@ -292,22 +486,50 @@ class Debugger:
     handle('run')(_change)
 
     def _log(self, node):
-        self.ui.windows['log'].write(node.toprettyxml(indent='   '))
-        pass # print node
+        '''responses nothing acts on; they are in the protocol log'''
 
     @handle('eval')
     def _eval(self, node):
-        id = int(node.getAttribute('transaction_id'))
-        if id in self.watching:
-            self.ui.windows['watch'].set_result(self.watching.pop(id), node)
-            self.ui.windows['watch'].expressions.focus()
+        self.watcher.handle(node)
+
+    @handle('property_get')
+    def _property_get(self, node):
+        if self.stream is not None and self.stream.handle(node):
+            return
+        if self.tree.handle(node):
+            return
+        if not self.watcher.handle(node):
+            self._log(node)
 
-    handle('property_get')(_log)
+    @handle('property_value')
+    def _property_value(self, node):
+        if self.stream is None or not self.stream.handle(node):
+            self._log(node)
     handle('property_set')(_log)
 
+    @handle('context_names')
+    def _context_names(self, node):
+        self.contexts.set_names(node)
+        if not self.engine:
+            return
+        known = self.capabilities.get(self.engine) or {}
+        known['contexts'] = self.contexts.names
+        try:
+            self.capabilities.set(self.engine, known)
+        except (IOError, OSError):
+            # no cache then; the next session asks again
+            pass
+
     @handle('context_get')
     def _context_get(self, node):
-        self.ui.windows['scope'].refresh(node)
+        cid = node.getAttribute('context')
+        if cid:
+            cid = int(cid)
+        else:
+            cid = ContextCache.LOCAL
+        self.limits.record(node.length)
+        self.contexts.update(cid, get_properties(node))
+        self.scheduler.mark('scope', self.ui.windows['scope'].refresh, self.contexts, self.tree)
 
     handle('feature_set')(_log)
 
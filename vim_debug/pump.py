@@ -0,0 +1,79 @@
+import Queue
+import socket
+import threading
+import time
+import vim
+
+import stats
+
+class Pump:
+    '''Feeds DBGp packets to the debugger without blocking vim.
+
+    A reader thread reads and parses packets off the socket as they come
+    and puts them on a queue, as (packet, raw xml) pairs; None marks the end
+    of the connection. A repeating vim timer runs `:Dbg pump`, which calls
+    tick() to dispatch queued packets until `budget` seconds have gone by.
+    While the pump runs, DBGP.get_packets waits on the queue instead of
+    reading the socket itself, so run/step commands can be sent without
+    waiting for their answer.'''
+
+    def __init__(self, bend, interval=50, budget=0.02):
+        self.bend = bend
+        self.interval = interval
+        self.budget = budget
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.timer = None
+        self.supported = vim.eval('has("timers") && has("lambda")') == '1'
+
+    def running(self):
+        return self.timer is not None
+
+    def start(self):
+        if not self.supported or self.running():
+            return False
+        # the thread may wait as long as the program runs
+        self.bend.sock.sock.settimeout(None)
+        self.thread = threading.Thread(target=self.read)
+        self.thread.daemon = True
+        self.thread.start()
+        self.bend.queue = self.queue
+        self.timer = vim.eval('timer_start(%d, {-> execute("Dbg pump", "")}, {"repeat": -1})'
+                              % self.interval)
+        return True
+
+    def read(self):
+        '''the reader thread; never touches vim'''
+        sock = self.bend.sock
+        try:
+            while sock.sock:
+                packet = sock.read_packet()
+                self.queue.put((packet, sock.last_body))
+        except (EOFError, socket.error):
+            pass
+        self.queue.put(None)
+
+    def tick(self):
+        '''dispatch queued packets for at most `budget` seconds'''
+        deadline = time.time() + self.budget
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Queue.Empty:
+                return
+            if item is None:
+                self.stop()
+                raise EOFError('Socket Closed')
+            self.bend.dispatch(*item)
+            stats.incr('pump.packets')
+            if time.time() >= deadline:
+                stats.incr('pump.over_budget')
+                return
+
+    def stop(self):
+        if self.timer is not None:
+            vim.command('call timer_stop(%s)' % self.timer)
+            self.timer = None
+        self.bend.queue = None
+
+# vim: et sw=4 sts=4
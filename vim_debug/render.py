@@ -0,0 +1,38 @@
+import difflib
+
+import stats
+
+class Renderer:
+    '''Brings a vim buffer in line with a list of lines using the smallest
+    set of line replacements, inserts and deletes, rather than clearing
+    and rewriting it. The cursor of the window showing the buffer is put
+    back where it was (vim keeps the scroll position itself as long as
+    the cursor doesn't move).'''
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+
+    def render(self, buffer, lines, window=None):
+        '''returns the number of lines touched'''
+        lines = list(str(item) for item in lines) or ['']
+        old = buffer[:]
+        if window is not None:
+            cursor = window.cursor
+        matcher = difflib.SequenceMatcher(None, old, lines, autojunk=False)
+        touched = 0
+        # bottom up, so the indices of the edits still to come stay valid
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                continue
+            buffer[i1:i2] = lines[j1:j2]
+            touched += max(i2 - i1, j2 - j1)
+        if window is not None and touched:
+            window.cursor = (min(cursor[0], len(lines)), cursor[1])
+        self.frames += 1
+        stats.incr('render.frames')
+        stats.incr('render.lines_touched', touched)
+        stats.set('render.%s.last_frame' % self.name, touched)
+        return touched
+
+# vim: et sw=4 sts=4
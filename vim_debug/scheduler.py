@@ -0,0 +1,73 @@
+import time
+import vim
+
+import stats
+
+class RedrawScheduler:
+    '''Coalesces pane redraws while the user is stepping quickly.
+
+    Handlers mark a pane dirty with the function that draws it; only the
+    latest one is kept. flush() draws the dirty panes, unless another key
+    is already waiting and the last flush was less than `interval`
+    seconds ago, in which case the drawing is put off until the keys run
+    out (or a timer fires). Replaced, never drawn states are counted as
+    skipped renders. Nothing is drawn while `ready()` says the panes
+    can't be (the debugger's tab page isn't the current one); the owner
+    flushes again once they can.'''
+
+    def __init__(self, interval=0.1, ready=lambda: True):
+        self.interval = interval
+        self.ready = ready
+        self.dirty = {}
+        self.order = []
+        self.last_flush = 0
+        self.timer = None
+        self.has_timers = vim.eval('has("timers") && has("lambda")') == '1'
+
+    def mark(self, name, func, *args):
+        if name in self.dirty:
+            stats.incr('redraw.skipped')
+        else:
+            self.order.append(name)
+        self.dirty[name] = func, args
+
+    def input_pending(self):
+        return vim.eval('getchar(1)') != '0'
+
+    def flush(self, force=False):
+        if not self.dirty:
+            return
+        if not self.ready():
+            stats.incr('redraw.hidden')
+            return
+        if not force and self.input_pending() and \
+                time.time() - self.last_flush < self.interval:
+            stats.incr('redraw.deferred')
+            self.defer()
+            return
+        order, dirty = self.order, self.dirty
+        self.order, self.dirty = [], {}
+        for name in order:
+            func, args = dirty[name]
+            func(*args)
+            stats.incr('redraw.rendered')
+        self.last_flush = time.time()
+
+    def defer(self):
+        '''make sure a flush still happens once the keys stop coming'''
+        if self.has_timers:
+            if self.timer is not None:
+                vim.command('call timer_stop(%s)' % self.timer)
+            self.timer = vim.eval('timer_start(%d, {-> execute("Dbg flush", "")})'
+                                  % int(self.interval * 1000))
+        else:
+            vim.command('augroup DbgFlush | exe "au!" | exe "au CursorHold * Dbg flush" | augroup END')
+
+    def stop(self):
+        if self.timer is not None:
+            vim.command('call timer_stop(%s)' % self.timer)
+            self.timer = None
+        if not self.has_timers:
+            vim.command('silent! au! DbgFlush')
+
+# vim: et sw=4 sts=4
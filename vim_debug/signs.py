@@ -0,0 +1,102 @@
+import vim
+
+import snapshot
+import stats
+
+def literal(value):
+    '''a vim expression for a python str, int, list or dict'''
+    if isinstance(value, (int, long)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ','.join(literal(item) for item in value)
+    if isinstance(value, dict):
+        return '{%s}' % ','.join('%s:%s' % (literal(k), literal(v)) for k, v in value.iteritems())
+    return "'%s'" % str(value).replace("'", "''")
+
+class SignManager:
+    '''Keeps the set of signs the debugger wants shown.
+
+    Callers change the wanted set with want()/drop()/clear(); apply()
+    compares it with what is placed and sends all of the differences in
+    one go -- sign_placelist/sign_unplacelist where vim has them, a single
+    batch of :sign commands otherwise. Sign ids come from a pool and are
+    reused once their sign is gone.'''
+
+    group = 'vimdebug'
+
+    def __init__(self):
+        self.wanted = {}    # key -> (name, file, line)
+        self.placed = {}    # key -> (id, name, file, line)
+        self.free = []
+        self.next_id = 1
+        self.has_lists = vim.eval('exists("*sign_placelist")') == '1'
+        self.has_execute = vim.eval('exists("*execute")') == '1'
+
+    def want(self, key, name, file, line):
+        self.wanted[key] = name, file, int(line)
+
+    def drop(self, key):
+        self.wanted.pop(key, None)
+
+    def clear(self):
+        self.wanted.clear()
+
+    def allocate(self):
+        if self.free:
+            return self.free.pop()
+        self.next_id += 1
+        return self.next_id - 1
+
+    def apply(self):
+        '''place and unplace whatever differs from the wanted set; nothing
+        is recorded as placed until vim has taken the commands'''
+        unplace = dict((key, old) for key, old in self.placed.iteritems()
+                       if self.wanted.get(key) != old[1:])
+        # the old ids aren't free yet, so a moved sign never shares an id
+        # with the one it replaces
+        place = dict((key, (self.allocate(),) + sign) for key, sign in self.wanted.iteritems()
+                     if key not in self.placed or key in unplace)
+        if place or unplace:
+            try:
+                self.send(place.values(), unplace.values())
+            except:
+                self.free.extend(new[0] for new in place.itervalues())
+                raise
+        for key in unplace:
+            del self.placed[key]
+        self.placed.update(place)
+        self.free.extend(old[0] for old in unplace.itervalues())
+        stats.incr('signs.placed', len(place))
+        stats.incr('signs.unplaced', len(unplace))
+
+    def send(self, place, unplace):
+        '''new signs go in before the old ones come out, so a moving sign
+        doesn't flicker'''
+        if self.has_lists:
+            if place:
+                vim.eval('sign_placelist(%s)' % literal(list(
+                    {'id':id, 'group':self.group, 'name':name, 'buffer':file, 'lnum':line}
+                    for id, name, file, line in place)))
+            if unplace:
+                vim.eval('sign_unplacelist(%s)' % literal(list(
+                    {'id':id, 'group':self.group, 'buffer':file}
+                    for id, name, file, line in unplace)))
+            return
+        cmds = list('sign place %d name=%s line=%d file=%s' % (id, name, line, file)
+                    for id, name, file, line in place)
+        cmds.extend('sign unplace %d file=%s' % (id, file) for id, name, file, line in unplace)
+        if self.has_execute:
+            vim.command('call execute(%s)' % literal(cmds))
+        else:
+            vim.command(' | '.join(cmds))
+
+    def jump(self, key):
+        id, name, file, line = self.placed[key]
+        if self.has_lists:
+            vim.command('sign jump %d group=%s file=%s' % (id, self.group, file))
+        else:
+            vim.command('sign jump %d file=%s' % (id, file))
+        # jumping can move to another window
+        snapshot.invalidate()
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,63 @@
+'''the vim state the UI keeps asking for, read with one vim.eval per action
+
+Between begin() and end() (one :Dbg command) the first get() reads
+winnr(), &lines, &columns, winwidth(0), winheight(0), whether this is
+the debugger's tab page and bufwinnr() of every debugger buffer at
+once, and later reads come from memory.
+Anything that changes the layout or the focus calls invalidate().'''
+
+import vim
+
+import stats
+
+names = []
+current = None
+depth = 0
+
+def watch(name):
+    '''have bufwinnr(name) read along with the rest'''
+    if name not in names:
+        names.append(name)
+
+def begin():
+    global depth
+    depth += 1
+
+def end():
+    global depth
+    depth -= 1
+    if not depth:
+        invalidate()
+
+def invalidate():
+    global current
+    current = None
+
+def read():
+    bufwinnrs = ', '.join("'%s':bufwinnr('%s')" % (name, name) for name in names)
+    values = vim.eval("{'winnr':winnr(), 'lines':&lines, 'columns':&columns, "
+                      "'winwidth':winwidth(0), 'winheight':winheight(0), "
+                      "'debugtab':exists('t:vim_debug'), "
+                      "'bufwinnr':{%s}}" % bufwinnrs)
+    stats.incr('snapshot.reads')
+    bufwinnr = dict((name, int(nr)) for name, nr in values.pop('bufwinnr').items())
+    values = dict((key, int(value)) for key, value in values.items())
+    values['bufwinnr'] = bufwinnr
+    return values
+
+def get(key):
+    global current
+    if current is not None:
+        return current[key]
+    values = read()
+    if depth:
+        current = values
+    return values[key]
+
+def bufwinnr(name):
+    winnrs = get('bufwinnr')
+    if name in winnrs:
+        return winnrs[name]
+    return int(vim.eval("bufwinnr('%s')" % name))
+
+# vim: et sw=4 sts=4
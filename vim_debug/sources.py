@@ -0,0 +1,53 @@
+import os
+import vim
+from collections import OrderedDict
+
+import stats
+
+class SourceBuffers:
+    '''Remembers the buffer of each source file shown during a session.
+
+    Going back to a file switches to its buffer by number instead of
+    running `edit!` again, which would re-read it from disk and reset the
+    buffer. A file is only reloaded when its mtime has changed. The `size`
+    most recently shown files are kept.
+
+    Their buffers get bufhidden=hide, as without 'hidden' vim unloads a
+    buffer as soon as no window shows it, and going back would read the
+    file again anyway. A file that drops out of the list gets its
+    bufhidden back.'''
+
+    def __init__(self, size=20):
+        self.size = size
+        self.files = OrderedDict()  # file -> (bufnr, mtime)
+
+    def mtime(self, file):
+        try:
+            return os.path.getmtime(file)
+        except OSError:
+            return None
+
+    def show(self, file):
+        '''show file in the current window'''
+        mtime = self.mtime(file)
+        entry = self.files.pop(file, None)
+        if entry is not None and entry[1] == mtime:
+            try:
+                vim.command('silent buffer! %d' % entry[0])
+                stats.incr('sources.reused')
+            except vim.error:
+                # wiped out behind our back
+                entry = None
+        if entry is None or entry[1] != mtime:
+            vim.command('silent edit! ' + file)
+            vim.command('setlocal bufhidden=hide')
+            stats.incr('sources.loaded')
+        self.files[file] = vim.current.buffer.number, mtime
+        while len(self.files) > self.size:
+            file, (bufnr, mtime) = self.files.popitem(last=False)
+            vim.command('silent! call setbufvar(%d, "&bufhidden", "")' % bufnr)
+
+    def clear(self):
+        self.files.clear()
+
+# vim: et sw=4 sts=4
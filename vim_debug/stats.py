@@ -0,0 +1,20 @@
+'''counters for the cost of UI work, shown with `:Dbg stats`'''
+
+counters = {}
+
+def incr(name, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+def set(name, value):
+    counters[name] = value
+
+def get(name):
+    return counters.get(name, 0)
+
+def reset():
+    counters.clear()
+
+def report():
+    return list('%-30s %s' % item for item in sorted(counters.items()))
+
+# vim: et sw=4 sts=4
@@ -1,66 +1,265 @@
+import bisect
+import os
+import tempfile
+import time
+import vim
+import xml.dom.minidom
+from collections import deque
+from xml.parsers.expat import ExpatError
+
 from window import VimWindow
+from columns import columns
 import errors
+import snapshot
 import base64
 
 class StackWindow(VimWindow):
-    '''Keeps track of the current execution stack'''
+    '''Keeps track of the current execution stack
+
+    Frames are fetched `page` at a time with `stack_get -d` (see
+    Debugger.get_frames), so a step reads the same number of frames
+    however deep the stack is; more are fetched when the end of the pane
+    is scrolled into view or `down` walks past them. A run of identical
+    frames (plain recursion) is drawn as one "xN" line.'''
     name = 'STACK'
     dtext = '[[Execution Stack - most recent call first]]'
+    match_id = 4201
+    page = 30
     def __init__(self, name = None):
         VimWindow.__init__(self, name)
+        self.reset()
+
+    def reset(self):
+        '''forget the frames of the last pause'''
         self.at = 0
+        self.depth = 0
+        self.loaded = 0     # frames 0..loaded-1 are all in self.frames
+        self.frames = {}    # level -> [level, where, filename, lineno]
+        self.rows = []      # [first level, number of frames] per line
 
     def refresh(self, node):
-        self.at = 0
-        stack = node.getElementsByTagName('stack')
-        self.stack = list(map(item.getAttribute, ('level', 'where', 'filename', 'lineno')) for item in stack)
-        self.clear()
+        self.update(node)
+        self.draw()
+        return self.frames[0]
+
+    def update(self, node):
+        '''read a stack_get response (the whole stack or some frames of it)
+        without drawing it'''
+        for item in node.getElementsByTagName('stack'):
+            frame = list(map(item.getAttribute, ('level', 'where', 'filename', 'lineno')))
+            self.frames[int(frame[0])] = frame
+        while self.loaded in self.frames:
+            frame = self.frames[self.loaded]
+            if self.rows and self.frames[self.rows[-1][0]][1:] == frame[1:]:
+                self.rows[-1][1] += 1
+            else:
+                self.rows.append([self.loaded, 1])
+            self.loaded += 1
+        self.depth = max(self.depth, self.loaded)
+        return self.frames.get(0)
+
+    def missing(self, end):
+        '''the levels below end that haven't been fetched'''
+        return list(level for level in range(self.loaded, min(end, self.depth))
+                    if level not in self.frames)
+
+    def row_of(self, level):
+        '''the row the frame at level is drawn on'''
+        return max(0, bisect.bisect_right(list(row[0] for row in self.rows), level) - 1)
+
+    def near_end(self):
+        '''is the last fetched frame in view, with more to fetch?'''
+        return self.loaded < self.depth and self.visible()[1] >= len(self.rows)
+
+    def draw(self):
         tpl = '%-2s %-15s %s:%s' 
-        lines = list(tpl % tuple(item) for item in self.stack)
-        self.writelines(lines)
-        self.highlight(0)
-        return self.stack[0]
+        lines = [self.dtext]
+        for first, count in self.rows:
+            level, where, file, line = self.frames[first]
+            if count == 1:
+                lines.append(tpl % (level, where, file, line))
+            else:
+                lines.append(tpl % ('%d-%d' % (first, first + count - 1), where, file, line)
+                             + '  x%d' % count)
+        if self.loaded < self.depth:
+            lines.append('   ... %d more frames' % (self.depth - self.loaded))
+        self.render(lines)
+        self.highlight(self.at)
 
     def on_create(self):
-        self.command('highlight CurStack term=reverse ctermfg=White ctermbg=Red gui=reverse')
+        has = vim.eval('[exists("*matchaddpos"), exists("*getwininfo"), exists("##WinScrolled")]')
+        self.has_matches = has[0] == '1'
+        self.has_wininfo = has[1] == '1'
+        events = 'CursorMoved'
+        if has[2] == '1':
+            events += ',WinScrolled'
+        self.command('highlight CurStack term=reverse ctermfg=White ctermbg=Red gui=reverse | '
+                     'autocmd %s <buffer> silent! Dbg more' % events)
         self.highlight(0)
 
     def highlight(self, num):
-        self.command('syntax clear')
-        self.command('syntax region CurStack start="^%d " end="$"' % num)
+        '''highlight frame num (its row + 2, under the header)'''
+        self.mark(self.row_of(num) + 2)
+
+    def mark(self, lnum):
+        '''move the CurStack highlight to line lnum; with matchaddpos this
+        only touches the one line, instead of re-highlighting the buffer'''
+        if not self.has_matches:
+            self.command('syntax clear')
+            self.command('syntax match CurStack "\\%%%dl.*"' % lnum)
+            return
+        self.command('silent! call matchdelete(%d) | call matchaddpos("CurStack", [%d], 10, %d)'
+                     % (self.match_id, lnum, self.match_id))
 
 class LogWindow(VimWindow):
-    '''I don't actually know what this does...'''
+    '''The DBGp traffic, oldest first.
+
+    `record` only keeps the raw frame, with its time and direction, in a
+    ring of the last `keep` frames. Frames are pretty-printed (one fold
+    each) when the pane is entered or scrolled, or on `:Dbg log`, and each
+    frame is formatted only once.'''
     name = 'LOG'
     dtext = '[[Logs all traffic]]'
+    keep = 500
+
+    def __init__(self, name = None):
+        VimWindow.__init__(self, name)
+        self.frames = deque(maxlen=self.keep)   # [time, direction, raw, lines]
+        self.recorded = 0
+        self.shown = 0
 
     def on_create(self):
         self.command('set nowrap fdm=marker fmr={{{,}}} fdl=0')
+        events = 'BufWinEnter,WinEnter,CursorMoved'
+        if vim.eval('exists("##WinScrolled")') == '1':
+            events += ',WinScrolled'
+        self.command('autocmd %s <buffer> silent! Dbg log' % events)
+
+    def record(self, direction, raw):
+        self.frames.append([time.time(), direction, raw, None])
+        self.recorded += 1
+
+    def format(self, frame):
+        if frame[3] is None:
+            when, direction, raw = frame[:3]
+            stamp = time.strftime('%H:%M:%S', time.localtime(when)) + '.%03d' % (when % 1 * 1000)
+            text = raw
+            if direction == 'recv':
+                try:
+                    text = xml.dom.minidom.parseString(raw).toprettyxml(indent='   ')
+                except ExpatError:
+                    pass
+            frame[3] = ['%s %s {{{' % (stamp, direction.upper())] + text.splitlines() + ['}}}']
+        return frame[3]
+
+    def show(self):
+        '''draw the frames recorded since the last show'''
+        if self.shown == self.recorded:
+            return
+        lines = [self.dtext]
+        for frame in self.frames:
+            lines.extend(self.format(frame))
+        self.render(lines)
+        self.shown = self.recorded
+
+    def dump(self, path):
+        out = open(path, 'w')
+        try:
+            for frame in self.frames:
+                out.write('\n'.join(self.format(frame)) + '\n')
+        finally:
+            out.close()
 
 class OutputWindow(VimWindow):
-    '''Logs the stdout + stderr'''
+    '''Logs the stdout + stderr
+
+    Only the last `keep` lines stay in the buffer; everything is also
+    written to a log file for the session (see `open_log`). Text added
+    between redraws is held back and written by one `flush`.'''
     name = 'STDOUT_STDERR'
     dtext = '[[Stdout and Stderr are copied here for your convenience]]\n'
+    keep = 1000
+
+    def __init__(self, name = None):
+        VimWindow.__init__(self, name)
+        self.last = 'stdout'
+        self.head = ''      # text continuing the last line in the buffer
+        self.pending = []   # whole new lines
+        self.logfile = None
+        self.log = None
 
     def on_create(self):
         self.command('set wrap fdm=marker fmr={{{,}}} fdl=0')
         self.command('setlocal wfw')
-        self.last = 'stdout'
 
     def add(self, type, text):
         # TODO: highlight stderr
         if type != self.last:
             self.last = type
             if type == 'stderr':
-                self.write('[[STDERR]]')
+                text = '\n[[STDERR]]\n' + text
             else:
-                self.write('[[STDOUT]]')
+                text = '\n[[STDOUT]]\n' + text
+        if self.log is None:
+            # mkstemp, as a predictable name in /tmp could be a symlink
+            # planted by someone else
+            fd, self.logfile = tempfile.mkstemp(prefix='vim_debug_output.', suffix='.log')
+            self.log = os.fdopen(fd, 'w')
+        self.log.write(text)
         lines = text.split('\n')
-        self.buffer[-1] += lines[0]
-        for line in lines[1:]:
-            self.buffer.append(line)
+        if self.pending:
+            self.pending[-1] += lines[0]
+        else:
+            self.head += lines[0]
+        self.pending.extend(lines[1:])
+
+    def flush(self):
+        '''write what was added since the last flush, dropping the oldest
+        lines from the buffer once there are more than `keep`'''
+        if not self.head and not self.pending:
+            return
+        self.prepare()
+        if self.head:
+            self.buffer[-1] += self.head
+        if self.pending:
+            self.buffer.append(self.pending[-self.keep:])
+        self.head, self.pending = '', []
+        # line 0 is the header
+        extra = len(self.buffer) - 1 - self.keep
+        if extra > 0:
+            del self.buffer[1:extra + 1]
         self.command('normal G')
 
+    def open_log(self):
+        '''show everything printed this session in a new window'''
+        if self.log is None:
+            return False
+        self.log.flush()
+        vim.command('silent botright split ' + self.logfile)
+        snapshot.invalidate()
+        return True
+
+    def destroy(self):
+        VimWindow.destroy(self)
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+            os.remove(self.logfile)
+
+class ValueWindow(VimWindow):
+    '''scratch buffer holding the full value of one property'''
+    name = 'VALUE'
+    dtext = ''
+
+    def on_create(self):
+        self.command('setlocal wrap noswapfile')
+
+    def add(self, text):
+        lines = text.split('\n')
+        self.buffer[-1] += lines[0]
+        if len(lines) > 1:
+            self.buffer.append(lines[1:])
+
 class WatchWindow:
     ''' window for watch expressions '''
 
@@ -79,7 +278,6 @@ class WatchWindow:
         self.results.destroy()
 
     def set_result(self, line, node):
-        l = len(self.results.buffer)
         for a in range(len(self.results.buffer)-1, line):
             self.results.buffer.append('')
         errors = node.getElementsByTagName('error')
@@ -90,7 +288,12 @@ class WatchWindow:
             res = str(get_text(prop))
             if not res:
                 res = str(get_child_text(prop, 'value'))
-        self.results.buffer[line] = res
+        if self.results.buffer[line] != res:
+            self.results.buffer[line] = res
+
+    def clear_result(self, line):
+        if line < len(self.results.buffer) and self.results.buffer[line]:
+            self.results.buffer[line] = ''
 
 def get_text(node):
     if not hasattr(node.firstChild, 'data'):
@@ -107,30 +310,119 @@ def get_child_text(node, child_tag):
     return get_text(tags[0])
 
 class ScopeWindow(VimWindow):
-    ''' lists the current scope (context) '''
+    ''' lists the current scope (context)
+
+    The rows are laid out in columns fitted to the window (see columns)
+    and all kept here; the buffer only gets the right
+    number of lines, and real text for the rows around the visible part
+    of the window. Scrolling fills in the rest (see `fill`).
+
+    Properties with children are drawn as a tree of folds. Until a fold
+    is first opened (`zo` or <CR>, which run `:Dbg expand`) it only holds
+    a placeholder line; after that the children fetched for it are drawn
+    under it. The fold levels come from `b:vim_debug_folds` (see
+    `add_rows`) rather than from markers in the text, as most lines only
+    get their text once they scroll into view.'''
 
     name = 'SCOPE'
     dtext = '[[Current scope variables...]]'
+    margin = 20
 
-    def refresh(self, node):
-        self.clear()
-        for child in node.getElementsByTagName('property'):
-            name = child.getAttribute('fullname')
-            type = child.getAttribute('type')
-            children = child.getAttribute('children')
-            if not name:
-                text = get_child_text(child, 'value')
-                name = get_child_text(child, 'fullname')
+    foldexpr = 'get(b:vim_debug_folds,v:lnum-1,0)'
+
+    def __init__(self, name = None):
+        VimWindow.__init__(self, name)
+        self.rows = [self.dtext]
+        self.names = [None]
+        self.folds = []
+
+    def on_create(self):
+        events = 'CursorMoved'
+        if vim.eval('exists("##WinScrolled")') == '1':
+            events += ',WinScrolled'
+        self.command('autocmd %s <buffer> silent! Dbg scroll' % events)
+        self.command('let b:vim_debug_folds = [] | '
+                     'setlocal foldmethod=expr foldexpr=%s foldlevel=0 | '
+                     'nnoremap <buffer> <silent> zo :Dbg expand<CR>| '
+                     'nnoremap <buffer> <silent> <CR> :Dbg expand<CR>' % self.foldexpr)
+        self.folds = []
+        self.has_wininfo = vim.eval('exists("*getwininfo")') == '1'
+
+    def refresh(self, contexts, tree=None):
+        '''draw every cached context, flagging values changed since their
+        last snapshot'''
+        entries = [self.dtext]
+        names = [None]
+        folds = ['0']
+        ids = contexts.ids()
+        for cid in ids:
+            if len(ids) > 1:
+                entries.append('[[%s]]' % contexts.names[cid])
+                names.append(None)
+                folds.append('0')
+            changed = lambda name: contexts.is_changed(cid, name)
+            self.add_rows(entries, names, folds, cid, contexts.properties(cid), tree, 0, changed)
+        self.prepare()
+        if folds != self.folds:
+            # setting foldexpr again makes vim work the folds out anew
+            self.command('let b:vim_debug_folds = [%s] | setlocal foldexpr=%s'
+                         % (','.join("'%s'" % level for level in folds), self.foldexpr))
+            self.folds = folds
+        # the buffer gets its length first, as that limits what is in view
+        self.resize(len(entries))
+        top, bottom, width = self.view()
+        self.rows = columns(entries, width)
+        self.names = names
+        self.fill((top, bottom))
+
+    def add_rows(self, entries, names, folds, cid, props, tree, depth, changed=None):
+        '''append the entries (see columns) for props, and the children
+        fetched for them; folds gets the fold level of each line, as
+        foldexpr gives it: a property with children starts a fold one
+        level deeper than its own'''
+        indent = '  ' * depth
+        for name, text, type, count in props:
+            mark = changed is not None and changed(name) and '*' or ' '
+            entries.append([mark + indent, name, text.replace('\n', '\\n'), type, ''])
+            names.append((cid, name, count))
+            if not count:
+                folds.append(str(depth))
+                continue
+            folds.append('>%d' % (depth + 1))
+            children = tree is not None and tree.get(cid, name)
+            if children:
+                self.add_rows(entries, names, folds, cid, children, tree, depth + 1)
             else:
-                if not child.firstChild:
-                    text = ''
-                elif hasattr(child.firstChild, 'data'):
-                    text = child.firstChild.data
-                else:
-                    text = ''
-                if child.hasAttribute('encoding') and child.getAttribute('encoding') == 'base64':
-                    text = base64.decodestring(text)
-            self.write('%-20s = %-10s /* type: %s */' % (name, text, type))
+                entries.append(' %s  ... %d children' % (indent, count))
+                names.append((cid, name, count))
+                folds.append(str(depth + 1))
+
+    def property_at(self, lnum):
+        '''(context id, name, number of children) of the property drawn on
+        line lnum'''
+        if 0 < lnum <= len(self.names) and self.names[lnum - 1] is not None:
+            return self.names[lnum - 1]
+        return None, None, 0
+
+    def resize(self, count):
+        '''give the buffer count lines'''
+        if len(self.buffer) < count:
+            self.buffer.append([''] * (count - len(self.buffer)))
+        elif len(self.buffer) > count:
+            del self.buffer[count:]
+
+    def fill(self, visible=None):
+        '''write the rows around the visible part of the window; refresh
+        passes visible, having already prepared and resized it'''
+        count = len(self.rows)
+        if visible is None:
+            self.prepare()
+            self.resize(count)
+        top, bottom = visible or self.visible()
+        start = max(0, top - 1 - self.margin)
+        end = min(count, bottom + self.margin)
+        if start < end:
+            self.renderer.render(self.buffer.range(start + 1, end), self.rows[start:end])
 
 help_text = '''\
 [ Function Keys ]                 |                      
@@ -1,7 +1,10 @@
-import os
 import vim
 
-from subwindows import WatchWindow, StackWindow, ScopeWindow, OutputWindow, LogWindow
+from window import set_focus
+from signs import SignManager
+from sources import SourceBuffers
+import snapshot
+from subwindows import WatchWindow, StackWindow, ScopeWindow, OutputWindow, LogWindow, ValueWindow
 
 class DebugUI:
     """ DEBUGUI class """
@@ -13,17 +16,19 @@ class DebugUI:
             'scope':ScopeWindow(),
             'output':OutputWindow(),
             'log':LogWindow(),
+            'value':ValueWindow(),
             # 'status':StatusWindow()
         }
         self.mode     = 0 # normal mode
         self.file     = None
         self.line     = None
-        self.winbuf   = {}
+        self.origin   = None
+        self.restore  = None
         self.breaks   = {}
         self.waiting  = {}
         self.toremove = {}
-        self.cursign  = None
-        self.sessfile = "/tmp/debugger_vim_saved_session." + str(os.getpid())
+        self.signs    = SignManager()
+        self.sources  = SourceBuffers()
         self.minibufexpl = minibufexpl
 
         # Set the buffer file, and the view count, so that
@@ -39,20 +44,23 @@ class DebugUI:
         self.mode = 1
         if self.minibufexpl == 1:
             vim.command('CMiniBufExplorer')         # close minibufexplorer if it is open
-        # save session
-        vim.command('mksession! ' + self.sessfile)
-        for i in range(1, len(vim.windows)+1):
-            vim.command(str(i)+'wincmd w')
-            self.winbuf[i] = vim.eval('bufnr("%")') # save buffer number, mksession does not do job perfectly
-                                                    # when buffer is not saved at all.
-
-        vim.command('silent topleft new')           # create srcview window (winnr=1)
-        for i in range(2, len(vim.windows)+1):
-            vim.command(str(i)+'wincmd w')
-            vim.command('hide')
+        # the debugger gets a tab page of its own, so the user's windows are
+        # left alone. The only thing that can change is their size, when
+        # the tab line shows up for the new tab; remember it in that case.
+        origin, tabs, showtabline, restore = vim.eval(
+            '[tabpagenr(), tabpagenr("$"), &showtabline, winrestcmd()]')
+        self.origin = int(origin)
+        if showtabline == '1' and tabs == '1':
+            self.restore = restore
+        # create srcview window (winnr=1), in a tab page marked as ours
+        vim.command('silent tabnew | let t:vim_debug = 1')
+        # draw what was put off while the user was in another tab
+        vim.command('augroup VimDebugTab | exe "au!" | '
+                    'exe "au TabEnter * if exists(\'t:vim_debug\') | silent! Dbg flush | endif" | '
+                    'augroup END')
         self.create()
         vim.command('1wincmd w') # goto srcview window(nr=1, top-left)
-        self.cursign = '1'
+        snapshot.invalidate()
 
         self.set_highlight()
 
@@ -61,30 +69,65 @@ class DebugUI:
         if self.mode == 0: # is normal mode ?
             return
 
-        vim.command('sign unplace 1')
-        vim.command('sign unplace 2')
-        for bid in self.breaks.keys():
-            file, line, tid = self.breaks.pop(bid)
-            vim.command('sign unplace %d file=%s' % (tid, file))
+        self.signs.clear()
+        self.signs.apply()
+        self.breaks.clear()
+        vim.command('silent! au! VimDebugTab')
+
+        # go back to the tab the user is in, unless it's the debugger's;
+        # tabs after the debugger's move down one when it is closed
+        current, tab = int(vim.eval('tabpagenr()')), self.tabnr()
+        back = current
+        if back == tab:
+            back = self.origin
+        if tab and back > tab:
+            back -= 1
 
         # destory all created windows
         self.destroy()
 
-        # restore session
-        vim.command('source ' + self.sessfile)
-        os.system('rm -f ' + self.sessfile)
+        # drop the debugger's tab and go back to where we came from
+        if tab:
+            vim.command('silent! tabclose %d' % tab)
+        vim.command('silent! tabnext %d' % back)
+        if self.restore is not None and back == self.origin:
+            vim.command(self.restore)
+        snapshot.invalidate()
 
         self.set_highlight()
 
-        self.winbuf.clear()
+        self.sources.clear()
         self.file = None
         self.line = None
+        self.origin = None
+        self.restore = None
         self.mode = 0
-        self.cursign = None
 
         if self.minibufexpl == 1:
             vim.command('MiniBufExplorer')                 # close minibufexplorer if it is open
 
+    def tabnr(self):
+        '''the number of the debugger's tab page; 0 once it is gone'''
+        marks = vim.eval('map(range(1, tabpagenr("$")), "gettabvar(v:val, \'vim_debug\')")')
+        if '1' not in marks:
+            return 0
+        return marks.index('1') + 1
+
+    def in_tab(self):
+        '''is the debugger's tab page the current one? Panes are only
+        drawn when it is, as anything else would open them in the
+        user's tab'''
+        return bool(snapshot.get('debugtab'))
+
+    def go_tab(self):
+        '''make the debugger's tab page the current one'''
+        if self.in_tab():
+            return
+        tab = self.tabnr()
+        if tab:
+            vim.command('tabnext %d' % tab)
+            snapshot.invalidate()
+
     def create(self):
         """ create windows """
         self.windows['output'].create('vertical belowright new')
@@ -95,6 +138,7 @@ class DebugUI:
         width = self.windows['output'].width + self.windows['scope'].width
         self.windows['output'].command('vertical res %d' % (width/2))
         self.windows['watch'].results.command('vertical res %d' % (width/4))
+        snapshot.invalidate()
 
     def set_highlight(self):
         """ set vim highlight of debugger sign """
@@ -104,25 +148,29 @@ class DebugUI:
     def unhighlight(self):
         self.windows['stack'].clear()
         self.windows['stack'].write('\n\n!!!!!---- Debugging has ended. Type `:dbg quit` to exit ----!!!!!\n\n')
-        self.windows['stack'].command('syntax clear')
-        self.windows['stack'].command('syntax region CurStack start="^!!!!!---- " end="$"')
+        # the message is the second to last line
+        self.windows['stack'].mark(len(self.windows['stack'].buffer) - 1)
         self.go_srcview()
-        vim.command('sign unplace ' + self.cursign)
+        self.signs.drop('current')
+        self.signs.apply()
 
     def stack_up(self):
+        '''move to the row above; a collapsed run of frames is one step'''
         stack = self.windows['stack']
-        if stack.at > 0:
-            stack.at -= 1
+        row = stack.row_of(stack.at)
+        if row > 0:
+            stack.at = stack.rows[row - 1][0]
             stack.highlight(stack.at)
-            item = stack.stack[stack.at]
+            item = stack.frames[stack.at]
             self.set_srcview(item[2], item[3])
 
     def stack_down(self):
         stack = self.windows['stack']
-        if stack.at < len(stack.stack)-1:
-            stack.at += 1
+        row = stack.row_of(stack.at)
+        if row < len(stack.rows) - 1:
+            stack.at = stack.rows[row + 1][0]
             stack.highlight(stack.at)
-            item = stack.stack[stack.at]
+            item = stack.frames[stack.at]
             self.set_srcview(item[2], item[3])
 
     def queue_break(self, tid, file, line):
@@ -132,18 +180,19 @@ class DebugUI:
         self.toremove[tid] = bid
 
     def set_break(self, tid, bid):
+        '''the sign shows up on the next signs.apply()'''
         if tid in self.waiting:
             file, line = self.waiting[tid]
             self.breaks[bid] = file, line, tid
-            vim.command('sign place %d name=breakpt line=%d file=%s' % (tid, line, file))
+            self.signs.want(('break', bid), 'breakpt', file, line)
         else:
             pass # print 'failed to set breakpoint... %d : %s' % (tid, self.waiting)
 
     def clear_break(self, tid):
         bid = self.toremove.pop(tid)
         if bid in self.breaks:
-            file, line, tid = self.breaks.pop(bid)
-            vim.command('sign unplace %d file=%s' % (tid, file))
+            self.breaks.pop(bid)
+            self.signs.drop(('break', bid))
         else:
             print 'failed to remove', bid
 
@@ -160,17 +209,15 @@ class DebugUI:
             window.destroy()
 
     def go_srcview(self):
-        vim.command('1wincmd w')
-
-    def next_sign(self):
-        if self.cursign == '1':
-            return '2'
-        else:
-            return '1'
+        if self.in_tab():
+            set_focus(1)
 
     def set_srcview(self, file, line):
         """ set srcview windows to file:line and replace current sign """
-        
+        if not self.in_tab():
+            # redrawn with the stack when the user comes back
+            return
+
         # For some reason the first two src refreshes are not what we want
         # to use. I believe the 2nd is correct.
         if self.src_view_count == 2:
@@ -186,21 +233,16 @@ class DebugUI:
         if file == self.file and self.line == line:
             return
 
-        nextsign = self.next_sign()
-
         if file != self.file:
             self.file = file
             self.go_srcview()
-            vim.command('silent edit! ' + file)
-
-        cmd = 'sign place %s name=current line=%s file=%s' % (nextsign, line, file)
-        vim.command(str(cmd))
-        vim.command('sign unplace ' + self.cursign)
+            self.sources.show(file)
 
-        vim.command('sign jump ' + nextsign + ' file='+file)
+        self.signs.want('current', 'current', file, line)
+        self.signs.apply()
+        self.signs.jump('current')
         #vim.command('normal z.')
 
         self.line = line
-        self.cursign = nextsign
 
 # vim: et sw=4 sts=4
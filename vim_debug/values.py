@@ -0,0 +1,87 @@
+import vim
+
+from subwindows import get_text
+
+# how to ask each engine for a slice of a value, (name, start, length)
+slices = {
+    'python':lambda name, start, length: '%s[%d:%d]' % (name, start, start + length),
+    'php':lambda name, start, length: 'substr(%s,%d,%d)' % (name, start, length),
+}
+
+class ValueStream:
+    '''Streams a (possibly huge) value into a ValueWindow in chunks.
+
+    The scope pane keeps its truncated values; this fetches the property
+    `chunk` bytes at a time with property_value, writing each chunk as it
+    arrives, until a short chunk comes back or the stream is cancelled.
+    start() only returns once the value is in, so the way to cancel is
+    Ctrl-C.'''
+
+    def __init__(self, window, name, type='python', frame=0, chunk=65536):
+        self.window = window
+        self.name = name
+        self.slice = slices.get(type, slices['python'])
+        self.frame = frame
+        self.chunk = chunk
+        self.size = None
+        self.received = 0
+        self.cancelled = False
+        self.done = False
+        self.tid = None
+
+    def start(self, bend):
+        if not self.window.isprepared():
+            self.window.create('botright new')
+        self.window.buffer[:] = ['']
+        self.tid = bend.command('property_get', 'd', self.frame, 'n', self.name, 'm', 1, suppress=True)
+        try:
+            bend.get_packets()
+            while not (self.done or self.cancelled):
+                # -m, or the engine cuts each chunk to max_data (see limits)
+                self.tid = bend.command('property_value', 'd', self.frame, 'm', self.chunk, 'n',
+                    self.slice(self.name, self.received, self.chunk), suppress=True)
+                bend.get_packets()
+        except KeyboardInterrupt:
+            # a packet that was half read stays on the socket (see
+            # PacketSocket.read_packet), so reading on is safe
+            self.cancel()
+            bend.get_packets()
+
+    def cancel(self):
+        self.cancelled = True
+        self.progress()
+
+    def handle(self, node):
+        '''consume a property_get/property_value response; returns False if
+        the response wasn't ours'''
+        if self.tid is None or int(node.getAttribute('transaction_id')) != self.tid:
+            return False
+        errors = node.getElementsByTagName('error')
+        if len(errors):
+            self.window.add('[[ERROR: %s]]' % errors[0].getAttribute('code'))
+            self.done = True
+        elif node.getAttribute('command') == 'property_get':
+            props = node.getElementsByTagName('property')
+            if props and props[0].getAttribute('size'):
+                self.size = int(props[0].getAttribute('size'))
+        else:
+            text = get_text(node)
+            self.window.add(text)
+            self.received += len(text)
+            if len(text) < self.chunk:
+                self.done = True
+        self.progress()
+        return True
+
+    def progress(self):
+        if self.cancelled:
+            msg = 'cancelled %s after %d bytes' % (self.name, self.received)
+        elif self.done:
+            msg = 'fetched %s (%d bytes)' % (self.name, self.received)
+        elif self.size:
+            msg = 'fetching %s... %d%%' % (self.name, self.received * 100 / max(self.size, 1))
+        else:
+            msg = 'fetching %s... %d bytes' % (self.name, self.received)
+        vim.command('redraw | echo "%s"' % msg.replace('"', '\\"'))
+
+# vim: et sw=4 sts=4
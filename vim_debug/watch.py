@@ -0,0 +1,54 @@
+class WatchEngine:
+    '''Evaluates the lines of the watch window as one pipelined batch.
+
+    Results are remembered per line, keyed on the expression, the stack
+    frame and the paused state they were evaluated in; a line is only sent
+    to the engine again when one of those changes.'''
+
+    def __init__(self, window):
+        self.window = window
+        self.pause = 0
+        self.keys = {}
+        self.pending = {}
+
+    def new_pause(self):
+        '''the engine has moved on, so every remembered result is stale'''
+        self.pause += 1
+
+    def evaluate(self, bend, frame=0):
+        '''send every watch expression whose result we don't already have'''
+        lines = self.window.expressions.buffer
+        for i, line in enumerate(lines[1:]):
+            lineno = i + 1
+            expr = line.strip()
+            if not expr:
+                if self.keys.pop(lineno, None) is not None:
+                    self.window.clear_result(lineno)
+                continue
+            key = (expr, frame, self.pause)
+            if self.keys.get(lineno) == key:
+                continue
+            if frame:
+                tid = bend.command('property_get', 'd', frame, 'n', expr, suppress=True)
+            else:
+                tid = bend.command('eval', data=expr, suppress=True)
+            self.pending[tid] = lineno, key
+        for lineno in list(self.keys):
+            if lineno >= len(lines):
+                del self.keys[lineno]
+                self.window.clear_result(lineno)
+        if self.pending:
+            bend.get_packets()
+
+    def handle(self, node):
+        '''consume an eval/property_get response; returns False if the
+        response wasn't one of ours'''
+        tid = int(node.getAttribute('transaction_id'))
+        if tid not in self.pending:
+            return False
+        lineno, key = self.pending.pop(tid)
+        self.keys[lineno] = key
+        self.window.set_result(lineno, node)
+        return True
+
+# vim: et sw=4 sts=4
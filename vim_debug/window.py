@@ -1,9 +1,32 @@
 import vim
 
+from render import Renderer
+import snapshot
+import stats
+
+has_win_execute = None
+
+def win_execute(winnr, cmd):
+    """ run cmd in window winnr without moving the focus there (and back),
+    if this vim can; returns False if it can't """
+    global has_win_execute
+    if has_win_execute is None:
+        has_win_execute = vim.eval('exists("*win_execute")') == '1'
+    if not has_win_execute:
+        return False
+    vim.command("call win_execute(win_getid(%d), '%s')" % (winnr, cmd.replace("'", "''")))
+    return True
+
+def set_focus(winnr):
+    stats.incr('focus.switches')
+    vim.command(str(winnr) + 'wincmd w')
+    snapshot.invalidate()
+
 class VimWindow:
     """ wrapper class of window of vim """
     name = 'DEBUG_WINDOW'
     dtext = ''
+    has_wininfo = False     # set by the windows that use visible()
     def __init__(self, name = None, special=True, height=0):
         """ initialize """
         if name is not None:
@@ -12,6 +35,8 @@ class VimWindow:
         self.height = height
         self.firstwrite = 1
         self.special = special
+        self.renderer = Renderer(self.name)
+        snapshot.watch(self.name)
 
     def isprepared(self):
         """ check window is OK """
@@ -25,7 +50,20 @@ class VimWindow:
     def on_create(self):
         pass
     def getwinnr(self):
-        return int(vim.eval("bufwinnr('"+self.name+"')"))
+        return snapshot.bufwinnr(self.name)
+
+    def view(self):
+        '''the first and last line shown in the window, and its width'''
+        winnr = self.getwinnr()
+        if self.has_wininfo:
+            info = vim.eval('getwininfo(win_getid(%d))[0]' % winnr)
+            return int(info['topline']), int(info['botline']), int(info['width'])
+        height, width = vim.eval('[winheight(%d), winwidth(%d)]' % (winnr, winnr))
+        return 1, int(height), int(width)
+
+    def visible(self):
+        '''the first and last line shown in the window'''
+        return self.view()[:2]
 
     def write(self, msg):
         """ append last """
@@ -43,6 +81,15 @@ class VimWindow:
         self.command('normal G')
         #self.window.cursor = (len(self.buffer), 1)
 
+    def render(self, lines):
+        """ make the buffer read `lines`, touching as few lines as possible """
+        self.prepare()
+        winnr = self.getwinnr()
+        window = None
+        if winnr != -1:
+            window = vim.windows[winnr - 1]
+        return self.renderer.render(self.buffer, lines, window)
+
     def create(self, method = 'new'):
         """ create window """
         vim.command('silent ' + method + ' ' + self.name)
@@ -54,15 +101,19 @@ class VimWindow:
         self.buffer.append('')
         if self.height != 0:
             vim.command('res %d' % self.height)
-        self.width = int( vim.eval("winwidth(0)") )
-        self.height = int( vim.eval("winheight(0)") )
+        snapshot.invalidate()
+        self.width = snapshot.get('winwidth')
+        self.height = snapshot.get('winheight')
         self.on_create()
 
     def destroy(self):
         """ destroy window """
         if self.buffer == None or len(dir(self.buffer)) == 0:
             return
-        self.command('bd %d' % self.buffer.number)
+        # not self.command, which would first open the window again if
+        # it isn't in the current tab page
+        vim.command('bd %d' % self.buffer.number)
+        snapshot.invalidate()
         self.firstwrite = 1
 
     def clear(self):
@@ -72,17 +123,19 @@ class VimWindow:
         self.firstwrite = 1
 
     def command(self, cmd):
-        """ go to my window & execute command """
+        """ execute command in my window, without focusing it if possible """
         self.prepare()
         winnr = self.getwinnr()
-        if winnr != int(vim.eval("winnr()")):
-            vim.command(str(winnr) + 'wincmd w')
+        if win_execute(winnr, cmd):
+            return
+        if winnr != snapshot.get('winnr'):
+            set_focus(winnr)
         vim.command(cmd)
 
     def focus(self):
         self.prepare()
         winnr = self.getwinnr()
-        if winnr != int(vim.eval("winnr()")):
-            vim.command(str(winnr) + 'wincmd w')
+        if winnr != snapshot.get('winnr'):
+            set_focus(winnr)
 
 # vim: et sw=4 sts=4
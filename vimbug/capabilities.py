@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+'''
+    vimbug.capabilities
+    ~~~~~~~~~~~~~~~~~~~
+
+    What a DBGp Server supports, cached on disk per engine so that a
+    session only has to ask once. This needs nothing but the standard
+    library, so that the vim_debug plugin can share the cache with
+    :mod:`vimbug.dbgp`.
+
+    :copyright: (c) 2011 by Lee Olayvar.
+    :license: MIT, see LICENSE for more details.
+'''
+import os
+import json
+
+
+#: The keys of a complete capabilities dict. See
+#: :meth:`vimbug.dbgp.DBGP.capabilities()`.
+CAPABILITIES = ('features', 'typemap', 'contexts')
+
+
+def engine_key(engine, version, language):
+    '''A key identifying a DBGp Server implementation, built from its
+    init packet.
+
+    :param engine:
+        The text of the `<engine>` element.
+    :param version:
+        The `version` attribute of the `<engine>` element.
+    :param language:
+        The `language` attribute of the `<init>` element.
+
+    :returns:
+        A string such as `'pydbgp 1.1.0 python'`, or None if the init
+        packet didn't name the engine.
+    '''
+    if not engine:
+        return None
+    return ' '.join(str(value) for value in (engine, version, language))
+
+
+class CapabilityCache(object):
+    '''A small on disk cache of what each DBGp Server supports, keyed by
+    the engine name and version found in its init packet. Since the engine
+    hardly ever changes between sessions, this lets us skip the
+    `feature_get`, `typemap_get` and `context_names` traffic on every
+    session but the first.
+    '''
+
+
+    def __init__(self, path=None):
+        '''
+        :param path:
+            The json file to store the capabilities in. If None,
+            `~/.vimbug/capabilities.json` is used.
+        '''
+        if path is None:
+            path = os.path.join(
+                os.path.expanduser('~'), '.vimbug', 'capabilities.json')
+
+        #: The path of the cache file.
+        self._path = path
+
+    def _load(self):
+        '''Load the whole cache file.
+
+        :returns:
+            A dict of engine keys to capability dicts. An empty dict is
+            returned if the file does not exist or cannot be read.
+        '''
+        try:
+            with open(self._path) as cache_file:
+                return json.load(cache_file)
+        except (IOError, ValueError):
+            return {}
+
+    def get(self, key):
+        '''Get the capabilities stored for an engine.
+
+        :param key:
+            The engine key. See :func:`engine_key()`.
+
+        :returns:
+            The capabilities dict, or None if nothing is cached for the key.
+        '''
+        return self._load().get(key)
+
+    def set(self, key, capabilities):
+        '''Store the capabilities of an engine.
+
+        :param key:
+            The engine key. See :func:`engine_key()`.
+        :param capabilities:
+            A json serializable dict, as returned by
+            :meth:`DBGPConnection.query_capabilities()`.
+        '''
+        cache = self._load()
+        cache[key] = capabilities
+
+        directory = os.path.dirname(self._path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self._path, 'w') as cache_file:
+            json.dump(cache, cache_file)
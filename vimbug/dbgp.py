@@ -17,9 +17,28 @@ import logging
 
 from lxml import etree
 
+from capabilities import CAPABILITIES, CapabilityCache, engine_key
+
 
 logger = logging.getLogger('vimbug.dbgp')
 
+#: The commands we ask a DBGp Server about with `feature_get`.
+QUERIED_COMMANDS = (
+    'breakpoint_set', 'breakpoint_remove', 'context_names', 'context_get',
+    'eval', 'property_get', 'property_value', 'property_set', 'stack_depth',
+    'stack_get', 'stdout', 'stderr', 'typemap_get', 'break', 'detach',
+)
+
+
+def _local_name(tag):
+    '''Strip the namespace from an lxml tag. Eg: '{urn:...}engine' becomes
+    'engine'. Comments and processing instructions have no name, so an
+    empty string is returned for them.
+    '''
+    if not isinstance(tag, basestring):
+        return ''
+    return tag.rsplit('}', 1)[-1]
+
 
 class DBGP:
     '''A friendly frontend which allows for cleaner access to a DBGp Server.
@@ -28,7 +47,7 @@ class DBGP:
     '''
     
     def __init__(self, host='localhost', port=9000, starter=None,
-                relative_uri=None):
+                relative_uri=None, capability_cache=None):
         '''
         :param host:
             The host of the DBGp Server.
@@ -48,6 +67,10 @@ class DBGP:
 
             Note that if this is None, the location of the current python
             working directory.
+        :param capability_cache:
+            A :class:`CapabilityCache` used by `capabilities()`. If None,
+            the capabilities are queried once per connection and not
+            stored.
         '''
 
         #: The host of the DBGp Server.
@@ -61,10 +84,52 @@ class DBGP:
         if relative_uri is None:
             self._relative_uri = os.path.abspath('.')
 
+        #: The capability cache, if any.
+        self._capability_cache = capability_cache
+
         #: The DBGPConnection object.
         self._dbgpcon = None
         #: The debug uri we want to debug.
         self._debug_uri = None
+        #: The capabilities of the connected DBGp Server. See
+        #: `capabilities()`.
+        self._capabilities = None
+
+    def capabilities(self):
+        '''Get what the connected DBGp Server supports. The server is only
+        queried if this engine is not already in the capability cache.
+
+        :returns:
+            A dict with the keys `features` *(command name to True/False)*,
+            `typemap` *(language type to common type)* and `contexts`
+            *(context id to name)*.
+        '''
+        if self._capabilities is not None:
+            return self._capabilities
+
+        key = self._dbgpcon.engine_key()
+        # An engine that doesn't name itself can't be told apart from
+        # any other, so it is never cached.
+        cache = self._capability_cache
+        if key is None:
+            cache = None
+        capabilities = None
+        if cache is not None:
+            capabilities = cache.get(key)
+            # Other clients may have stored only part of what we need.
+            if capabilities is not None and not all(
+                    name in capabilities for name in CAPABILITIES):
+                capabilities = None
+
+        if capabilities is None:
+            capabilities = self._dbgpcon.query_capabilities()
+            if cache is not None:
+                cache.set(key, capabilities)
+        else:
+            logger.debug('Using cached capabilities for %s' % key)
+
+        self._capabilities = capabilities
+        return capabilities
 
     def connect_debug(self):
         '''Connect the debug process. When called, this function will start
@@ -75,6 +140,7 @@ class DBGP:
         if self.connection_exists():
             raise NotImplementedError()
 
+        self._capabilities = None
         self._dbgpcon = DBGPConnection(
             self._debug_uri,
             host=self._host,
@@ -240,18 +306,47 @@ class DBGPConnection:
         # If we are connected, we should grab the init data and
         # save it for this connection object.
         if self._connected:
-            init_data = self.receive()
-            # Note that we are doing this so that we can simply keep
-            # the dict, rather than an lxml Element object.
-            for key in init_data.keys():
-                self._init_data[key] = init_data.get(key)
-            logger.debug('DBGp Connection Init Packet: %r' % self._init_data)
+            self.read_init()
+
+    def read_init(self):
+        '''Receive the init packet of the DBGp Server, and keep its
+        attributes, plus the engine name and version, in a dict.
+
+        :returns:
+            The init data dict.
+        '''
+        self._init_data = {}
+        init_data = self.receive()
+        # Note that we are doing this so that we can simply keep
+        # the dict, rather than an lxml Element object.
+        for key in init_data.keys():
+            self._init_data[key] = init_data.get(key)
+        # The engine name and version live in a child element, rather
+        # than an attribute.
+        for child in init_data:
+            if _local_name(child.tag) == 'engine':
+                self._init_data['engine'] = (child.text or '').strip()
+                self._init_data['engine_version'] = child.get('version')
+        logger.debug('DBGp Connection Init Packet: %r' % self._init_data)
+        return self._init_data
 
     def connected(self):
         '''Check whether or not a connection is active with this DBGPConnection
         '''
         return self._connected
 
+    def engine_key(self):
+        '''A key identifying the DBGp Server implementation, built from the
+        init packet.
+
+        :returns:
+            A string such as `'pydbgp 1.1.0 python'`, or None if the
+            init packet didn't name the engine.
+        '''
+        return engine_key(self._init_data.get('engine'),
+                          self._init_data.get('engine_version'),
+                          self._init_data.get('language'))
+
     def disconnect(self, stop=True):
         '''Close the DBGp Socket Connection.
         
@@ -265,6 +360,53 @@ class DBGPConnection:
         self._listener.close()
         self._connected = False
 
+    def query_capabilities(self, commands=QUERIED_COMMANDS):
+        '''Ask the DBGp Server which commands it supports, its typemap and
+        its context names. All of the requests are sent before any of the
+        responses are read.
+
+        :param commands:
+            The command names to query with `feature_get`.
+
+        :returns:
+            See :meth:`DBGP.capabilities()`.
+        '''
+        for name in commands:
+            self.send('feature_get', kwargs={'n':name})
+        self.send('typemap_get')
+        self.send('context_names')
+
+        capabilities = {
+            'features':{},
+            'typemap':{},
+            'contexts':{},
+        }
+        remaining = len(commands) + 2
+        while remaining > 0:
+            response = self.receive()
+            if response is None:
+                # Nothing more is coming.
+                break
+            if _local_name(response.tag) != 'response':
+                continue
+            remaining -= 1
+
+            command = response.get('command')
+            if command == 'feature_get':
+                capabilities['features'][response.get('feature_name')] = (
+                    response.get('supported') == '1')
+            elif command == 'typemap_get':
+                for child in response:
+                    capabilities['typemap'][child.get('name')] = child.get(
+                        'type')
+            elif command == 'context_names':
+                for child in response:
+                    capabilities['contexts'][child.get('id')] = child.get(
+                        'name')
+
+        logger.debug('DBGp Server capabilities: %r' % capabilities)
+        return capabilities
+
     def receive(self):
         '''Receive whatever data is in queue and convert it to an etree XML
         object.
@@ -2,11 +2,29 @@
 '''
 
 import logging
+from vim_tools import commands, layout
 from vim_tools.gui import Buffer, Window
+from vim_tools.layout import Pane, Split
 
 
 logger = logging.getLogger('vimbug')
 
+#: The layout of the vim gui. The source takes the left 55% of the frame,
+#: and the debug info is stacked on the right, with the prompt and its
+#: output sharing the top row half and half.
+LAYOUT = Split('vertical', [
+    Pane('source', buffer='source', size=0.55),
+    Split('horizontal', [
+        Split('vertical', [
+            Pane('prompt', buffer='prompt', size=0.225),
+            Pane('prompt_output', buffer='prompt_out'),
+        ]),
+        Pane('stack', buffer='stack'),
+        Pane('scope', buffer='scope'),
+        Pane('stdout_stderr', buffer='stdstream'),
+    ]),
+])
+
 
 class Interface(object):
     pass
@@ -39,39 +57,61 @@ class VimGui(Interface):
     def _create_windows(self):
         '''Create the windows for the vim gui.'''
 
+        if not layout.supported():
+            # This vim can't jump between windows by id, so fall back to
+            # splitting one window at a time.
+            self._split_windows()
+            return
+
+        # Build every window in one go..
+        built = layout.build(LAYOUT, self.buffers, focus='source')
+
+        # ..and then wrap the windows it reports, without looking any of
+        # them up again.
         self.windows = {}
-        # Create an instance of our current window..
-        self.windows['source'] = Window(id='source')
-        # And all our splits from that.
-        self.windows['stdstream'] = self.windows['source'].split(
-            plane='vertical', new_window_side='right',
-            id='stdout_stderr')
-        self.windows['scope'] = self.windows['stdstream'].split(
-            plane='horizontal', new_window_side='above',
-            id='scope')
-        self.windows['stack'] = self.windows['scope'].split(
-            plane='horizontal', new_window_side='above',
-            id='stack')
-        self.windows['prompt'] = self.windows['stack'].split(
-            plane='horizontal', new_window_side='above',
-            id='prompt')
-        self.windows['prompt_out'] = self.windows['prompt'].split(
-            plane='vertical', new_window_side='right',
-            id='prompt_output')
-
-        source_width = 0.55
-        # The right column is 45% wide, so we want to make our
-        # prompt 50% of that.
-        prompt_width = (1.0 - source_width) / 2
-
-        # Set the width of a couple windows.
-        self.windows['source'].set_width(source_width, use_percentage=True)
-        self.windows['prompt'].set_width(prompt_width, use_percentage=True)
-
-        # Add the buffers
-        for key, window in self.windows.items():
-            # We assume the buffers and windows share the same key.
-            window.set_buffer(self.buffers[key])
+        for pane in LAYOUT.panes():
+            if pane.id in built:
+                self.windows[pane.buffer] = Window.existing(pane.id)
+
+    def _split_windows(self):
+        '''Create the windows for the vim gui, one split at a time.'''
+
+        # Gather the layout commands so that they reach vim in as few
+        # calls as possible.
+        with commands.batch():
+            self.windows = {}
+            # Create an instance of our current window..
+            self.windows['source'] = Window(id='source')
+            # And all our splits from that.
+            self.windows['stdstream'] = self.windows['source'].split(
+                plane='vertical', new_window_side='right',
+                id='stdout_stderr')
+            self.windows['scope'] = self.windows['stdstream'].split(
+                plane='horizontal', new_window_side='above',
+                id='scope')
+            self.windows['stack'] = self.windows['scope'].split(
+                plane='horizontal', new_window_side='above',
+                id='stack')
+            self.windows['prompt'] = self.windows['stack'].split(
+                plane='horizontal', new_window_side='above',
+                id='prompt')
+            self.windows['prompt_out'] = self.windows['prompt'].split(
+                plane='vertical', new_window_side='right',
+                id='prompt_output')
+
+            source_width = 0.55
+            # The right column is 45% wide, so we want to make our
+            # prompt 50% of that.
+            prompt_width = (1.0 - source_width) / 2
+
+            # Set the width of a couple windows.
+            self.windows['source'].set_width(source_width, use_percentage=True)
+            self.windows['prompt'].set_width(prompt_width, use_percentage=True)
+
+            # Add the buffers
+            for key, window in self.windows.items():
+                # We assume the buffers and windows share the same key.
+                window.set_buffer(self.buffers[key])
 
     def close(self, load_original_state=True):
         ''''''
@@ -85,6 +125,7 @@ class VimGui(Interface):
 
         logger.debug('Loading VimGui..')
 
-        self._create_buffers()
-        self._create_windows()
+        with commands.ui_action():
+            self._create_buffers()
+            self._create_windows()
  
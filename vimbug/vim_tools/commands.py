@@ -9,6 +9,7 @@
     :license: MIT, see LICENSE for more details.
 '''
 import logging
+from contextlib import contextmanager
 from random import randint
 
 from error import BufferNotFoundError, WIDConflictError, WIDNotFoundError
@@ -23,9 +24,29 @@ logger = logging.getLogger('vim_tools')
 try:
     from vim import eval as vim_eval
     from vim import command as vim_command
+    from vim import buffers as vim_buffers
 except ImportError:
     logger.warning('Vim import failed.')
 
+#: The commands gathered by :func:`batch()`. None when not batching.
+_batched_commands = None
+#: Whether vim has the `execute()` function. Checked on the first flush.
+_has_execute = None
+#: Whether vim has the `win_execute()` function. See :func:`_win_execute()`.
+_has_win_execute = None
+#: How many times the focus has been moved to another window. See
+#: :func:`get_focus_switches()`.
+_focus_switches = 0
+#: A dict of w:id to winnr for the current tab. See :func:`_window_index()`.
+_window_ids_index = None
+#: The value of `g:vimbug_window_tick` when the index was built.
+_window_ids_tick = None
+#: The vim state read by :func:`get_snapshot()`, kept until the end of the
+#: current :func:`ui_action()` or until the layout changes.
+_snapshot = None
+#: How many :func:`ui_action()` contexts we are in.
+_ui_action_depth = 0
+
 
 def _format_expression(expression):
     '''A little function to format an expression for vim. Eg: strings are
@@ -45,6 +66,41 @@ def _format_expression(expression):
     else:
         return '"%s"' % expression
 
+def _flush_batch():
+    '''Run the commands gathered by :func:`batch()` so far, in a single
+    call to vim when possible.
+    '''
+    global _batched_commands, _has_execute
+    if not _batched_commands:
+        return
+    commands_ = _batched_commands
+    _batched_commands = []
+
+    if _has_execute is None:
+        _has_execute = vim_eval('exists("*execute")') == '1'
+
+    if len(commands_) == 1:
+        vim_command(commands_[0])
+    elif _has_execute:
+        # execute() takes a list of commands, and unlike a newline joined
+        # string it works for commands that swallow "|", such as :normal.
+        vim_command('call execute(%s)' % _vim_list(commands_))
+    else:
+        for command_ in commands_:
+            vim_command(command_)
+
+def _vim_list(items):
+    '''Format a list of python strings as a vim list of literal strings.
+
+    :param items:
+        The strings to format.
+
+    :returns:
+        A string such as `['one', 'it''s']`.
+    '''
+    return '[%s]' % ', '.join("'%s'" % item.replace("'", "''")
+                              for item in items)
+
 def _set_focus(winnr):
     '''The private version of :func:`set_focus()`. The only difference is
     that this function takes a winnr, rather than a window id. This is
@@ -56,6 +112,9 @@ def _set_focus(winnr):
         **Note**: This winnr *is *not** checked for existance. In other words,
         this may blow up if not checked before hand.
     '''
+    global _focus_switches
+    _focus_switches += 1
+    invalidate_snapshot()
     command('exec "normal! \\<C-W>".%s.\'w\'' % winnr)
 
 def _toggle_buffer(formatted_expression, func, args=None, kwargs=None):
@@ -89,9 +148,9 @@ def _toggle_buffer(formatted_expression, func, args=None, kwargs=None):
     if kwargs is None:
         kwargs = {}
 
-    # Get the current and target buffers..
-    original_bufnr = buffer_eval('bufnr("%")')
-    target_bufnr = buffer_eval('bufnr(%s)' % formatted_expression)
+    # Get the current and target buffers in one go..
+    original_bufnr, target_bufnr = eval_list(
+        ['bufnr("%")', 'bufnr(%s)' % formatted_expression])
     same_bufnr = original_bufnr == target_bufnr
     if target_bufnr == '-1':
         raise BufferNotFoundError(
@@ -99,14 +158,15 @@ def _toggle_buffer(formatted_expression, func, args=None, kwargs=None):
             '%s' % formatted_expression)
 
     if same_bufnr:
-        return func(*ags, **kwargs)
+        return func(*args, **kwargs)
 
-    # Change the active buffer..
-    command('b %s' % target_bufnr)
-    # Get the result
-    func_result = func(*args, **kwargs)
-    # And now change it back.
-    command('b %s' % original_bufnr)
+    with batch():
+        # Change the active buffer..
+        command('b %s' % target_bufnr)
+        # Get the result
+        func_result = func(*args, **kwargs)
+        # And now change it back.
+        command('b %s' % original_bufnr)
 
     return func_result
 
@@ -136,17 +196,120 @@ def _toggle_window(winnr, func, args=None, kwargs=None):
         args = tuple()
     if kwargs is None:
         kwargs = {}
-    original_winnr = eval('winnr()')
+
+    if func is command and not kwargs and _win_execute(winnr, *args):
+        # The command ran in place, without the focus ever moving.
+        return None
+
+    original_winnr = get_snapshot()['winnr']
     
-    if original_winnr == winnr:
+    if original_winnr == int(winnr):
         return func(*args, **kwargs)
 
-    _set_focus(winnr)
-    func_result = func(*args, **kwargs)
-    _set_focus(original_winnr)
+    with batch():
+        _set_focus(winnr)
+        func_result = func(*args, **kwargs)
+        _set_focus(original_winnr)
 
     return func_result
 
+def _install_window_tick():
+    '''Define `g:vimbug_window_tick`, and the autocmds which increase it
+    each time the window layout may have changed.
+    '''
+    window_events = 'WinNew,TabEnter'
+    if eval('exists("##WinClosed")') == '1':
+        window_events += ',WinClosed'
+    else:
+        # Without WinClosed, the best we can do is notice that some window
+        # got entered after one was closed.
+        window_events += ',WinEnter'
+
+    with batch():
+        command('let g:vimbug_window_tick = 0')
+        command('augroup vimbug_window_tick')
+        command('autocmd!')
+        command('autocmd %s * let g:vimbug_window_tick += 1' % window_events)
+        command('augroup END')
+
+def _win_execute(winnr, command_):
+    '''Run a command in the context of a window without moving the focus,
+    which also means no WinEnter/BufEnter autocmds and no redraw.
+
+    :param winnr:
+        The window number.
+    :param command_:
+        The command to execute.
+
+    :returns:
+        True if the command was run, False if this vim has no
+        `win_execute()` and the caller has to toggle the focus instead.
+    '''
+    global _has_win_execute
+    if _has_win_execute is None:
+        _has_win_execute = eval('exists("*win_execute")') == '1'
+    if not _has_win_execute:
+        return False
+
+    command('call win_execute(win_getid(%s), %s)' % (
+        winnr, _vim_list([command_])[1:-1]))
+    return True
+
+def _window_ids():
+    '''Get the w:id of every window in the current tab, with a single eval.
+
+    :returns:
+        A list of w:id strings, indexed by winnr - 1. Windows without an id
+        have an empty string.
+    '''
+    return eval('map(range(1, winnr("$")), \'getwinvar(v:val, "id")\')')
+
+def _window_index():
+    '''Get the w:id to winnr index for the current tab. The index is only
+    rebuilt when `g:vimbug_window_tick` says the layout changed, and when
+    it is, the tick and every w:id are read in the same eval.
+
+    :returns:
+        A dict of w:id strings to winnrs.
+    '''
+    global _window_ids_index, _window_ids_tick
+
+    if _window_ids_tick is None:
+        _install_window_tick()
+
+    tick = eval('g:vimbug_window_tick')
+    if _window_ids_index is not None and tick == _window_ids_tick:
+        return _window_ids_index
+
+    tick, ids = eval_list([
+        'g:vimbug_window_tick',
+        'map(range(1, winnr("$")), \'getwinvar(v:val, "id")\')',
+    ])
+    index = {}
+    for winnr, id in enumerate(ids):
+        # Remember, winnr's start at 1 not 0. Also, only the first window
+        # with a given id counts.
+        if id and id not in index:
+            index[id] = winnr + 1
+    _window_ids_index = index
+    _window_ids_tick = tick
+    return index
+
+def invalidate_snapshot():
+    '''Throw away the current snapshot. Anything which changes the layout,
+    the focus or a window size calls this, so that the next
+    :func:`get_snapshot()` reads vim again.
+    '''
+    global _snapshot
+    _snapshot = None
+
+def invalidate_window_index():
+    '''Force the next window id lookup to read every w:id again. Only needed
+    after changing w:id or the layout in a way the autocmds can't see.
+    '''
+    global _window_ids_index
+    _window_ids_index = None
+
 def assign_id_to_winnr(id=None, winnr=None):
     '''Assign a window id for a window.
 
@@ -169,21 +332,48 @@ def assign_id_to_winnr(id=None, winnr=None):
     if winnr is None:
         # Get the window number if it is None.
         winnr = int(eval('winnr()'))
-        current_winnr = winnr
-    else:
-        current_winnr = int(eval('winnr()'))
 
     winnr_id = eval('getwinvar(%s, "id")' % winnr)
-    if winnr_id is not None:
+    if winnr_id:
         # If the target winnr is not None, then we need to fail so we don't
         # overwrite the id.
         raise WIDConflictError('The winnr:%s already has an id when a write '
                                'was attempted. Current id:%s, attempted '
                                'id:%s' % (winnr, winnr_id, id))
 
-    # We have to toggle ourselves, since no w:id exists to pass into
-    # window_command()
-    _toggle_window(winnr, command, args=('let w:id="%s"' % id,))
+    # setwinvar() reaches the window without toggling to it.
+    command('call setwinvar(%s, "id", "%s")' % (winnr, id))
+    # No autocmd fires for a new w:id, so keep the index in step ourselves.
+    if _window_ids_index is not None:
+        _window_ids_index.setdefault(str(id), int(winnr))
+
+@contextmanager
+def batch():
+    '''Gather every :func:`command()` run within this context and send them
+    to vim in one go when the context exits. Eg..::
+
+        with batch():
+            command('vertical new')
+            command('let w:id="scope"')
+
+    An :func:`eval()` within the context first runs the commands gathered
+    so far, so that it sees their effects. Nested batches are merged into
+    the outermost one.
+    '''
+    global _batched_commands
+    if _batched_commands is not None:
+        # We're already batching, the outer batch will do the flushing.
+        yield
+        return
+
+    _batched_commands = []
+    try:
+        yield
+    finally:
+        try:
+            _flush_batch()
+        finally:
+            _batched_commands = None
 
 def buffer_command(command_, expression=None):
     '''Run the given command in the specified buffer, if any.
@@ -251,9 +441,13 @@ def command(command_):
     '''A simple local function for vim.command.
 
     :param command_:
-        The string to execute.
+        The string to execute. If within a :func:`batch()`, the command is
+        queued rather than executed.
     '''
-    vim_command(command_)
+    if _batched_commands is not None:
+        _batched_commands.append(command_)
+    else:
+        vim_command(command_)
 
 def create_buffer(name):
     '''Create a new buffer.
@@ -271,8 +465,7 @@ def delete_buffer_content(bufnr):
     :param bufnr:
         The buffer number to delete.
     '''
-    # Grabbed from irc support.. not sure if the underscore is even useful..
-    buffer_command(command_='%delete _', expression=bufnr)
+    set_buffer_lines(bufnr, [])
 
 def eval(eval_):
     '''A simple local function for vim.eval.
@@ -283,20 +476,30 @@ def eval(eval_):
     :returns:
         The product of `vim.eval(eval_)`.
     '''
+    # Anything batched has to run first, or we could be looking at stale
+    # state.
+    _flush_batch()
     return vim_eval(eval_)
 
-def find_unique_window_id(self):
+def eval_list(evals):
+    '''Evaluate several expressions with a single call to vim.
+
+    :param evals:
+        A list of expression strings.
+
+    :returns:
+        A list of the results, in the same order as evals.
+    '''
+    return eval('[%s]' % ', '.join(evals))
+
+def find_unique_window_id():
     '''Check every single window var to find a winvar that does not
     exist. This is done by taking the "largest" winvar, and incremented
     by one.
     '''
-    total_windows = int(eval('winnr("$")'))
-
     largest_winid = 0
-    # Remember, winnr's start at 1, not 0.
-    for _winnr in range(1, total_windows+1):
-        winvar_result = eval('getwinvar(%s, "id")' % _winnr)
-        if winvar_result is not None:
+    for winvar_result in _window_ids():
+        if winvar_result:
             try:
                 winvar_result = int(winvar_result)
             except ValueError:
@@ -312,13 +515,44 @@ def find_unique_window_id(self):
     # So increase it by one, and everyone's happy!
     return largest_winid + 1
 
+def get_snapshot():
+    '''Get the vim state the gui asks for over and over, read with a single
+    eval. Within a :func:`ui_action()` the result is kept, so later calls
+    cost nothing until :func:`invalidate_snapshot()`. Outside of one, vim
+    is read every time.
+
+    :returns:
+        A dict with the int values `winnr` *(the current window)*, `lines`,
+        `columns` *(the vim frame)*, `winwidth` and `winheight` *(the
+        current window)*.
+    '''
+    global _snapshot
+    if _snapshot is not None:
+        return _snapshot
+
+    values = eval('{"winnr":winnr(), "lines":&lines, "columns":&columns, '
+                  '"winwidth":winwidth(0), "winheight":winheight(0)}')
+    values = dict((key, int(value)) for key, value in values.items())
+    if _ui_action_depth:
+        _snapshot = values
+    return values
+
+def get_focus_switches():
+    '''Get how many times these commands have had to move the focus to
+    another window (and back), since vim started.
+
+    :returns:
+        The number of focus switches.
+    '''
+    return _focus_switches
+
 def get_current_winnr():
     '''Simply get the current winnr.
 
     :returns:
         The currently active window number. Converted to an int.
     '''
-    return int(eval('winnr()'))
+    return get_snapshot()['winnr']
 
 def get_buffer_name(expression):
     '''Get a buffer name.
@@ -356,13 +590,40 @@ def get_buffer_number(expression=None):
             'No buffer matching the following expression: %s' % expression)
     return int(eval_result)
 
+def get_buffer_object(bufnr):
+    '''Get the python `vim.buffers` object of a buffer. Reading and writing
+    through it needs neither a buffer switch nor a window switch.
+
+    :param bufnr:
+        The buffer number.
+
+    :raises BufferNotFoundError:
+        Raised if there is no buffer with that number.
+
+    :returns:
+        The vim buffer object.
+    '''
+    bufnr = int(bufnr)
+    try:
+        # Newer vims map buffer numbers to buffers..
+        buffer = vim_buffers[bufnr]
+        if buffer.number == bufnr:
+            return buffer
+    except (KeyError, IndexError):
+        pass
+    # ..while older ones only offer a list.
+    for buffer in vim_buffers:
+        if buffer.number == bufnr:
+            return buffer
+    raise BufferNotFoundError('No buffer with the number: %s' % bufnr)
+
 def get_vim_height():
     '''Get the height of the vim frame itself.
 
     :returns:
         The height of the vim frame itself, in lines.
     '''
-    return int(eval('&lines'))
+    return get_snapshot()['lines']
 
 def get_vim_width():
     '''Get the width of the vim frame itself.
@@ -370,7 +631,7 @@ def get_vim_width():
     :returns:
         The width of the vim frame itself, in lines.
     '''
-    return int(eval('&columns'))
+    return get_snapshot()['columns']
 
 def get_winnr_from_id(id):
     '''Get the winnr from the given window id.
@@ -382,15 +643,28 @@ def get_winnr_from_id(id):
         The first winnr that has the wid specified. None is returned
         if none are found to match.
     '''
+    return _window_index().get(str(id))
+
+def set_buffer_lines(bufnr, lines, start=0, end=None):
+    '''Replace a range of lines in a buffer with a single slice assignment
+    on the vim buffer object. The current buffer and window are left alone.
 
-    total_windows = int(eval('winnr("$")'))
-    # Remember, winnr's start at 1 not 0
-    for winnr in range(1, total_windows+1):
-        winvar_result = eval('getwinvar(%s, "id")' % winnr)
-        if winvar_result == str(id):
-            return winnr
-    # No matches found. Return None
-    return None
+    :param bufnr:
+        The buffer number.
+    :param lines:
+        A list of strings, without newlines.
+    :param start:
+        The first line to replace, starting at 0.
+    :param end:
+        The line to stop replacing at *(exclusive)*. If None, every line
+        from start to the end of the buffer is replaced.
+    '''
+    # The buffer could have been touched by a batched command.
+    _flush_batch()
+    buffer = get_buffer_object(bufnr)
+    if end is None:
+        end = len(buffer)
+    buffer[start:end] = lines
 
 def set_buffer_type(type, expression=None):
     '''Set the buftype variable for the given expression. If any.
@@ -428,6 +702,7 @@ def set_window_height(id, height):
     '''
     winnr = get_winnr_from_id(id)
     _toggle_window(winnr, command, args=('resize %s' % height,))
+    invalidate_snapshot()
 
 def set_window_width(id, width):
     '''Set the window width.
@@ -439,6 +714,24 @@ def set_window_width(id, width):
     '''
     winnr = get_winnr_from_id(id)
     _toggle_window(winnr, command, args=('vertical resize %s' % width,))
+    invalidate_snapshot()
+
+@contextmanager
+def ui_action():
+    '''Mark one gui action, such as loading the gui. Within the context,
+    :func:`get_snapshot()` reads vim once and then answers from memory,
+    until something changes the layout. Nested actions are merged into the
+    outermost one.
+    '''
+    global _ui_action_depth
+    _ui_action_depth += 1
+    try:
+        yield
+    finally:
+        _ui_action_depth -= 1
+        if not _ui_action_depth:
+            # Between actions the user is free to move things around.
+            invalidate_snapshot()
 
 def window_command(command_, id=None, toggle=True):
     '''Execute a command within the specified window, if any.
@@ -470,6 +763,8 @@ def window_command(command_, id=None, toggle=True):
     else:
         _set_focus(winnr)
         command(command_)
+    # Window commands are splits and resizes more often than not.
+    invalidate_snapshot()
 
 def window_eval(eval_, id=None, toggle=True):
     '''Run the given eval in the specified window, if any.
@@ -495,9 +790,8 @@ def window_eval(eval_, id=None, toggle=True):
         eval(eval_)
 
 def window_id_exists(id):
-    '''Check whether a window id exists or not. Currently this is done by
-    looping through all of the windows and seeing if an id exists. In
-    the future a tab var holding all of the ids is planned.. i think?
+    '''Check whether a window id exists or not. This is a lookup in the
+    window id index, see :func:`get_winnr_from_id()`.
 
     :param id:
         The id to check.
@@ -506,25 +800,24 @@ def window_id_exists(id):
         True if a window is found to have a w:id variable with the value of
         id, and False otherwise.
     '''
-    total_windows = int(eval('winnr("$")'))
-    
-    # Remember, winnr's start at 1, not 0.
-    for _winnr in range(1, total_windows+1):
-        winvar_result = eval('getwinvar(%s, "id")' % _winnr)
-        if winvar_result is not None and winvar_result == str(id):
-            return True
-    return False
+    return str(id) in _window_index()
 
 def write_buffer(text, line='$', expression=None):
-    '''Write text to a buffer.
+    '''Write text to a buffer, through the vim buffer object.
 
     :param text:
         The text to write.
+    :param line:
+        The line to write the text after, starting at 1. '$' is the last
+        line.
+    :param expression:
+        A string expression to find a buffer from. See
+        :func:`buffer_command()` documentation for reference.
     '''
-    if isinstance(text, basestring):
-        # Wrap the string in quotes so that it is submitted to the command
-        # as a vim string.
-        line = '"%s"' % line
-    buffer_command(command_='call append(line(%s), %s)' % (line, text.split('\n')),
-                   expression=expression)
+    # The buffer could have been touched by a batched command.
+    _flush_batch()
+    buffer = get_buffer_object(get_buffer_number(expression))
+    if line == '$':
+        line = len(buffer)
+    buffer[line:line] = text.split('\n')
 
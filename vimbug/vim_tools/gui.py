@@ -92,9 +92,10 @@ class Buffer(object):
                 'text':text,
             }
 
-        # Now delete, and write the text.
-        self.delete()
-        commands.write_buffer(text, expression=self._buffer_number)
+        # Replace everything in one go. This goes through the vim buffer
+        # object, so neither the current buffer nor the alternate buffer
+        # change.
+        commands.set_buffer_lines(self._buffer_number, text.split('\n'))
 
 class Window(object):
     '''An instance of a Vim window.'''
@@ -157,6 +158,22 @@ class Window(object):
                 return
         # The code path should never reach here.
 
+    @classmethod
+    def existing(cls, id):
+        '''Wrap a window which is already known to have the given id,
+        such as one made by :func:`vim_tools.layout.build()`, without
+        searching vim for it.
+
+        :param id:
+            The w:id of the window.
+
+        :returns:
+            A :class:`Window` instance for that id.
+        '''
+        window = cls.__new__(cls)
+        window._id = id
+        return window
+
     def command(self, command):
         '''Execute a command in the context of this window.
         
@@ -188,7 +205,7 @@ class Window(object):
         :returns:
             True if it does, False otherwise.
         '''
-        focused_winnr = commands.eval('winnr()')
+        focused_winnr = commands.get_current_winnr()
         return focused_winnr == self.get_winnr()
 
     def set_buffer(self, buffer):
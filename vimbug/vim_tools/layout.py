@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+'''
+    vim_tools.layout
+    ~~~~~~~~~~~~~~~~
+
+    Declarative window layouts. A layout is a tree of :class:`Split` and
+    :class:`Pane` objects which is compiled into a single Vimscript
+    sequence, so that every split, buffer, id and size is set in one go
+    rather than with a round trip to vim for each window.
+
+    :copyright: (c) 2011 by Lee Olayvar
+    :license: MIT, see LICENSE for more details.
+'''
+import commands
+
+
+class Pane(object):
+    '''A leaf of a layout. One window, showing one buffer.'''
+
+
+    def __init__(self, id, buffer=None, size=None):
+        '''
+        :param id:
+            The w:id given to the window.
+        :param buffer:
+            The key of the buffer to show, looked up in the buffers given to
+            :func:`build()`. If None, the window keeps whatever buffer it
+            was split with.
+        :param size:
+            The size of the window, as a percentage *(0.0 through 1.0)* of
+            the vim frame along the plane of the parent split. If None, vim
+            decides.
+        '''
+        self.id = id
+        self.buffer = buffer
+        self.size = size
+
+    def panes(self):
+        '''Get every pane within this node.
+
+        :returns:
+            A list of :class:`Pane` instances, in layout order.
+        '''
+        return [self]
+
+
+class Split(object):
+    '''A layout node which divides its area between its children.'''
+
+
+    def __init__(self, plane, children, size=None):
+        '''
+        :param plane:
+            The plane to split on, either `horizontal` *(children stacked
+            top to bottom)* or `vertical` *(children side by side, left to
+            right)*.
+        :param children:
+            A list of :class:`Split` and :class:`Pane` instances.
+        :param size:
+            See :class:`Pane`.
+        '''
+        self.plane = plane
+        self.children = children
+        self.size = size
+
+    def panes(self):
+        '''Get every pane within this node.
+
+        :returns:
+            A list of :class:`Pane` instances, in layout order.
+        '''
+        panes = []
+        for child in self.children:
+            panes.extend(child.panes())
+        return panes
+
+
+def _compile(node, buffers, lines, sizes, keys, key, plane=None):
+    '''Append the commands building `node` to lines. The node is built in
+    the window stored as `g:vimbug_layout_tmp[key]`, which must be the
+    current window.
+
+    :param node:
+        A :class:`Split` or :class:`Pane`.
+    :param buffers:
+        A dict of buffer keys to :class:`vim_tools.gui.Buffer` instances.
+    :param lines:
+        The list of commands being built.
+    :param sizes:
+        A list of `(key, plane, size)` tuples, for the windows to resize
+        once every window exists.
+    :param keys:
+        A list of every key handed out so far. Its length is the next key.
+    :param key:
+        The key of this node's window in `g:vimbug_layout_tmp`.
+    :param plane:
+        The plane of the parent split, if any. Used to size this node.
+    '''
+    if node.size is not None:
+        sizes.append((key, plane, node.size))
+
+    if isinstance(node, Pane):
+        lines.append('let w:id = "%s"' % node.id)
+        if node.buffer is not None:
+            lines.append('buffer %s' % buffers[node.buffer].get_number())
+        lines.append('let g:vimbug_layout["%s"] = win_getid()' % node.id)
+        return
+
+    split_command = {
+        'horizontal':'rightbelow split',
+        'vertical':'rightbelow vsplit',
+    }[node.plane]
+
+    # Create every child window first, so they share the area evenly. The
+    # first child keeps this node's window (and key)..
+    child_keys = [key]
+    for child in node.children[1:]:
+        child_keys.append(len(keys))
+        keys.append(child_keys[-1])
+        lines.append(split_command)
+        lines.append('let g:vimbug_layout_tmp[%s] = win_getid()' %
+                     child_keys[-1])
+
+    # ..and then build each of them within its own window.
+    for child_key, child in zip(child_keys, node.children):
+        lines.append('call win_gotoid(g:vimbug_layout_tmp[%s])' % child_key)
+        _compile(child, buffers, lines, sizes, keys, child_key,
+                 plane=node.plane)
+
+def build(layout, buffers=None, focus=None):
+    '''Build a layout, starting from the current window.
+
+    :param layout:
+        The root :class:`Split` or :class:`Pane`.
+    :param buffers:
+        A dict of buffer keys to :class:`vim_tools.gui.Buffer` instances,
+        for the panes which name a buffer.
+    :param focus:
+        The id of the pane to focus once the layout is built. If None, the
+        first pane.
+
+    :returns:
+        A dict of pane ids to vim window ids *(as given by `win_getid()`)*,
+        read back with a single eval.
+    '''
+    if buffers is None:
+        buffers = {}
+    if focus is None:
+        focus = layout.panes()[0].id
+
+    lines = [
+        'let g:vimbug_layout = {}',
+        'let g:vimbug_layout_tmp = {0:win_getid()}',
+    ]
+    sizes = []
+    _compile(layout, buffers, lines, sizes, [0], 0)
+
+    # Sizes go last, in layout order so outer splits are sized first.
+    vim_dimension = {
+        'horizontal':('resize', '&lines'),
+        'vertical':('vertical resize', '&columns'),
+    }
+    for key, plane, size in sizes:
+        if plane is None:
+            # The root has nothing to be sized against.
+            continue
+        resize, dimension = vim_dimension[plane]
+        lines.append('call win_gotoid(g:vimbug_layout_tmp[%s])' % key)
+        lines.append('exe "%s " . float2nr(%s * %s)' % (
+            resize, dimension, size))
+
+    lines.append('call win_gotoid(g:vimbug_layout["%s"])' % focus)
+    lines.append('unlet g:vimbug_layout_tmp')
+
+    with commands.batch():
+        for line in lines:
+            commands.command(line)
+    # The w:id of every pane changed behind the index's back.
+    commands.invalidate_window_index()
+    commands.invalidate_snapshot()
+
+    return dict((id, int(winid)) for id, winid in
+                commands.eval('g:vimbug_layout').items())
+
+def supported():
+    '''Check whether this vim can build layouts.
+
+    :returns:
+        True if vim has `win_getid()` and `win_gotoid()`, False otherwise.
+    '''
+    return commands.eval(
+        'exists("*win_getid") && exists("*win_gotoid")') == '1'